@@ -10,10 +10,76 @@ class InputDataType(Enum):
         return self.name
 
 
+class VideoReaderType(Enum):
+    OPENCV = "OPENCV"
+    MOVIEPY = "MOVIEPY"
+
+    def __str__(self):
+        return self.name
+
+
+class ResizeBackend(Enum):
+    OPENCV = "OPENCV"
+    SKIMAGE = "SKIMAGE"
+
+    def __str__(self):
+        return self.name
+
+
 class MatcherType(Enum):
     SIFT = "SIFT"
     ORB = "ORB"
     SURF = "SURF"
+    AKAZE = "AKAZE"
+    BRISK = "BRISK"
+
+    def __str__(self):
+        return self.name
+
+
+class MatcherBackend(Enum):
+    BRUTE_FORCE = "BRUTE_FORCE"
+    FLANN = "FLANN"
+
+    def __str__(self):
+        return self.name
+
+
+class ExtractionMode(Enum):
+    PER_OBJECT = "PER_OBJECT"
+    PER_FRAME = "PER_FRAME"
+
+    def __str__(self):
+        return self.name
+
+
+class FeatureBudget(Enum):
+    FIXED = "FIXED"
+    ADAPTIVE = "ADAPTIVE"
+
+    def __str__(self):
+        return self.name
+
+
+class TrackingMode(Enum):
+    MATCHING = "MATCHING"
+    OPTICAL_FLOW = "OPTICAL_FLOW"
+
+    def __str__(self):
+        return self.name
+
+
+class VelocitySmoothing(Enum):
+    WINDOW = "WINDOW"
+    EXPONENTIAL = "EXPONENTIAL"
+
+    def __str__(self):
+        return self.name
+
+
+class TranslationEstimator(Enum):
+    MEAN = "MEAN"
+    MEDIAN = "MEDIAN"
 
     def __str__(self):
         return self.name
@@ -33,13 +99,22 @@ class CameraType(Enum):
 
 INPUT_PATH = "no path set"
 INPUT_DATA_TYPE = InputDataType.VIDEO
+VIDEO_READER = VideoReaderType.OPENCV
 INPUT_DIMENSIONS = (1920, 1080)
 INPUT_FPS = 60
 OUTPUT_FPS = 10
+DETECT_EVERY_N_FRAMES = 1
+DETECTION_BATCH_SIZE = 1
+RESIZE_BACKEND = ResizeBackend.SKIMAGE
+USE_DETECTION_CACHE = True
 FROM_SEC_OR_IMAGE = 0
 TO_SEC_OR_IMAGE = 2
-MATCHER_TYPE = MatcherType.SIFT
+VELOCITY_SMOOTHING = VelocitySmoothing.WINDOW
+TRANSLATION_ESTIMATOR = TranslationEstimator.MEAN
 VIDEO_SCALE = 1
 CAMERA_TYPE = CameraType.IPHONE_XR_4K_60
+UNDISTORT = False
+DECODE_THREADS = 2
+PREFETCH_FRAMES = 8
 
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -3,42 +3,185 @@ Main entrypoint
 """
 import argparse
 import asyncio
+from time import time
+
+from tabulate import tabulate
 
 import Constants
+from Constants import TrackingMode
+from data_model.DetectedObjects import DetectedObjects
+from data_model.ObjectInstance import create_objects
+from matcher.MatcherStrategy import MatcherStrategy
+from mrcnn import visualize
+from mrcnn.Mask_R_CNN_COCO import detect_batch, get_detector
+from utils.DetectionCache import DetectionCache
+from utils.FrameSource import PrefetchingFrameSource
+from utils.VideoReader import get_video_fps
+from utils.export_utils import write_detected_objects_to_csv
+from utils.image_utils import save_debug_image, show, prepare_video_output
 from utils.timer import print_timing_results, timing
 
 
+class TrackingPipeline:
+    """
+    Tracking state, output and runtime of one matcher. Several pipelines run side by side on the same frames and
+    detections, so that matchers can be compared in a single pass.
+    """
+
+    def __init__(self, matcher: MatcherStrategy, tracking_mode: TrackingMode, suffix=""):
+        """
+        :param matcher: matcher with the backend and extraction settings the objects are tracked with
+        :param tracking_mode: how new objects are associated with the object tracks, see DetectedObjects
+        :param suffix: distinguishes the debug images and exports of several pipelines
+        """
+        self.matcher = matcher
+        self.tracking_mode = tracking_mode
+        self.detected_objects = DetectedObjects(matcher, tracking_mode)
+        self.output_video = prepare_video_output(Constants.INPUT_PATH, matcher.matcher_type.value, Constants.FROM_SEC_OR_IMAGE, Constants.TO_SEC_OR_IMAGE, Constants.OUTPUT_FPS, Constants.INPUT_DIMENSIONS)
+        self.suffix = suffix
+        self.tracking_time = 0.0  # feature extraction, matching and tracking, without detection and drawing
+
+    def process_frame(self, frame, result):
+        timestamp = "" if frame.timestamp is None else f" ({frame.timestamp:.3f}s)"
+        start = time()
+        if result is not None:
+            # With optical flow, features are only extracted for the objects that need them while adding them
+            with_features = self.tracking_mode == TrackingMode.MATCHING
+            newly_detected_objects = create_objects(result, frame.image, self.matcher, with_features)
+            self.detected_objects.add_objects(newly_detected_objects, frame.image)
+            self.tracking_time += time() - start
+            print(f"Frame {frame.number}{timestamp}{self.suffix}: detected {len(newly_detected_objects)} objects. {self.detected_objects.get_number_of_object_tracks()} total objects")
+        else:
+            # Objects are only moved along their predicted trajectory in between key frames
+            self.detected_objects.interpolate_objects()
+            self.tracking_time += time() - start
+            print(f"Frame {frame.number}{timestamp}{self.suffix}: interpolated. {self.detected_objects.get_number_of_object_tracks()} total objects")
+
+        result_frame = visualize.draw_instances(frame.image, self.detected_objects, interpolated_frame=result is None)
+
+        show(result_frame, "Frame" + self.suffix, await_keypress=False)
+        asyncio.run(save_debug_image(result_frame, "frame_" + str(frame.number) + self.suffix))
+        self.output_video.write(result_frame)
+
+    def finish(self):
+        self.output_video.release()
+        write_detected_objects_to_csv(self.detected_objects, "test" + self.suffix)
+
+
 @timing
-def process_video():
+def process_video(matchers, tracking_mode: TrackingMode):
     """
-    Processes the video defined in Constants.
+    Processes the video defined in Constants with one tracking pipeline per matcher.
     Saves frames for debugging, outputs video and saves results as csv.
     """
-    output_video = prepare_video_output(Constants.INPUT_PATH, Constants.MATCHER_TYPE.value, Constants.FROM_SEC_OR_IMAGE, Constants.TO_SEC_OR_IMAGE, Constants.OUTPUT_FPS, Constants.INPUT_DIMENSIONS)
-    detected_objects = DetectedObjects()
+    pipelines = [TrackingPipeline(matcher, tracking_mode, "" if len(matchers) == 1 else f"_{matcher}") for matcher in matchers]
+    detection_cache = None
+    if Constants.USE_DETECTION_CACHE:
+        extra_key = {"undistort": Constants.UNDISTORT, "video_reader": Constants.VIDEO_READER}
+        if Constants.UNDISTORT:
+            extra_key["camera_type"] = Constants.CAMERA_TYPE  # frames are undistorted with the calibration of the camera
+        detection_cache = DetectionCache(Constants.INPUT_PATH, get_detector().config, extra_key=extra_key)
 
-    for frame_number, frame in enumerate(get_frames(Constants.INPUT_DATA_TYPE, Constants.INPUT_PATH, Constants.FROM_SEC_OR_IMAGE, Constants.TO_SEC_OR_IMAGE, undistort=False)):
-        result = detect(frame)
+    frame_source = PrefetchingFrameSource(
+        Constants.INPUT_DATA_TYPE,
+        Constants.INPUT_PATH,
+        Constants.FROM_SEC_OR_IMAGE,
+        Constants.TO_SEC_OR_IMAGE,
+        undistort=Constants.UNDISTORT,
+        number_of_threads=Constants.DECODE_THREADS,
+        queue_size=Constants.PREFETCH_FRAMES,
+        video_reader=Constants.VIDEO_READER,
+    )
 
-        newly_detected_objects = create_objects(result, frame)
-        detected_objects.add_objects(newly_detected_objects)
+    number_of_frames = 0
+    for frames in get_batches(frame_source, Constants.DETECTION_BATCH_SIZE):
+        results = detect_key_frames(frames, detection_cache)
 
-        result_frame = visualize.draw_instances(frame, detected_objects)
+        for frame, result in zip(frames, results):
+            for pipeline in pipelines:
+                pipeline.process_frame(frame, result)
+            number_of_frames += 1
 
-        print(f"Frame {frame_number}: detected {len(newly_detected_objects)} objects. {len(detected_objects.objects)} total objects")
-        show(result_frame, "Frame", await_keypress=False)
-        asyncio.run(save_debug_image(result_frame, "frame_" + str(frame_number)))
-        output_video.write(result_frame)
+    for pipeline in pipelines:
+        pipeline.finish()
+    print_pipeline_results(pipelines, number_of_frames)
 
-    output_video.release()
-    write_detected_objects_to_csv(detected_objects, "test")
 
+def print_pipeline_results(pipelines, number_of_frames):
+    """
+    Prints the tracking throughput and number of object tracks of every pipeline
+    """
+    headers = ["Matcher", "tracking time", "frames per second", "# object tracks"]
+    rows = []
+    for pipeline in pipelines:
+        fps = number_of_frames / pipeline.tracking_time if pipeline.tracking_time > 0 else float("inf")
+        rows.append([str(pipeline.matcher), pipeline.tracking_time, fps, pipeline.detected_objects.get_number_of_object_tracks()])
+    print("\nPipeline results: ")
+    print(tabulate(rows, headers))
 
-def main():
+
+def is_key_frame(frame) -> bool:
+    """
+    :returns whether the detection is run on this frame
+    """
+    return frame.number % Constants.DETECT_EVERY_N_FRAMES == 0
+
+
+def get_batches(frames, key_frames_per_batch):
+    """
+    Generator grouping consecutive frames into lists that contain up to key_frames_per_batch key frames each
+    """
+    batch = []
+    number_of_key_frames = 0
+    for frame in frames:
+        if is_key_frame(frame):
+            if number_of_key_frames == key_frames_per_batch:
+                yield batch
+                batch = []
+                number_of_key_frames = 0
+            number_of_key_frames += 1
+        batch.append(frame)
+    if batch:
+        yield batch
+
+
+def detect_key_frames(frames, detection_cache):
+    """
+    Runs the detection on all key frames at once. Results are read from the detection cache if one is provided and
+    only frames without cached result are detected.
+    :returns a list with the detection result for each key frame and None for all other frames
+    """
+    results = [None] * len(frames)
+    indices_to_detect = []
+    for i, frame in enumerate(frames):
+        if is_key_frame(frame):
+            results[i] = None if detection_cache is None else detection_cache.load(get_frame_cache_index(frame))
+            if results[i] is None:
+                indices_to_detect.append(i)
+
+    detected_results = detect_batch([frames[i].image for i in indices_to_detect])
+    for i, result in zip(indices_to_detect, detected_results):
+        results[i] = result
+        if detection_cache is not None:
+            detection_cache.store(get_frame_cache_index(frames[i]), result)
+    return results
+
+
+def get_frame_cache_index(frame) -> int:
+    """
+    :returns the index the detection of the frame is cached under, independent of the first processed frame: the
+    timestamp in milliseconds for videos (not derived from the fps, which can be overridden) or the image number
+    """
+    if frame.timestamp is not None:
+        return round(frame.timestamp * 1000)
+    return Constants.FROM_SEC_OR_IMAGE + frame.number
+
+
+def main(matchers, tracking_mode: TrackingMode):
     """
     Main entry point.
     """
-    process_video()
+    process_video(matchers, tracking_mode)
     print_timing_results()
 
 
@@ -71,6 +214,14 @@ if __name__ == "__main__":
         default=Constants.InputDataType.VIDEO,
         help="Input type can be a VIDEO or a directory with IMAGEs",
     )
+    parser.add_argument(
+        "--videoReader",
+        dest="videoReader",
+        type=Constants.VideoReaderType,
+        choices=list(Constants.VideoReaderType),
+        default=Constants.VideoReaderType.OPENCV,
+        help="Library used to decode videos can be OPENCV or MOVIEPY",
+    )
     parser.add_argument(
         "--inputDimensions",
         dest="inputDimensions",
@@ -89,10 +240,56 @@ if __name__ == "__main__":
     parser.add_argument(
         "--matcherType",
         dest="matcherType",
+        nargs="+",
         type=Constants.MatcherType,
         choices=list(Constants.MatcherType),
-        default=Constants.MatcherType.ORB,
-        help="Matcher type can be SIFT, SURF or ORB"
+        default=[Constants.MatcherType.ORB],
+        help="Matcher type can be SIFT, SURF, ORB, AKAZE or BRISK. Several matchers run side by side on the same frames and detections"
+    )
+    parser.add_argument(
+        "--matcherBackend",
+        dest="matcherBackend",
+        type=Constants.MatcherBackend,
+        choices=list(Constants.MatcherBackend),
+        default=Constants.MatcherBackend.BRUTE_FORCE,
+        help="Match descriptors exhaustively or approximately with an index built once per new object, can be BRUTE_FORCE or FLANN"
+    )
+    parser.add_argument(
+        "--extractionMode",
+        dest="extractionMode",
+        type=Constants.ExtractionMode,
+        choices=list(Constants.ExtractionMode),
+        default=Constants.ExtractionMode.PER_OBJECT,
+        help="Extract features once per object or once per frame for all objects can be PER_OBJECT or PER_FRAME"
+    )
+    parser.add_argument(
+        "--featureBudget",
+        dest="featureBudget",
+        type=Constants.FeatureBudget,
+        choices=list(Constants.FeatureBudget),
+        default=Constants.FeatureBudget.FIXED,
+        help="Number of keypoints per object fixed by the matcher or adaptive to the mask area can be FIXED or ADAPTIVE"
+    )
+    parser.add_argument(
+        "--maxFeaturesPerFrame",
+        dest="maxFeaturesPerFrame",
+        type=int,
+        default=4000,
+        help="Maximum number of keypoints of all objects of a frame with the ADAPTIVE feature budget"
+    )
+    parser.add_argument(
+        "--downscaleLargeObjects",
+        dest="downscaleLargeObjects",
+        action="store_true",
+        help="Extract features of large objects on a coarser level of an image pyramid"
+    )
+    parser.add_argument(
+        "--trackingMode",
+        dest="trackingMode",
+        type=Constants.TrackingMode,
+        choices=list(Constants.TrackingMode),
+        default=Constants.TrackingMode.MATCHING,
+        help="Associate objects and measure their translation by matching the features extracted in every frame or by tracking the keypoints with optical flow can be MATCHING or OPTICAL_FLOW"
     )
     parser.add_argument(
         "--cameraType",
@@ -105,9 +302,25 @@ if __name__ == "__main__":
     parser.add_argument(
         "--inputFps",
         dest="inputFps",
-        type=int,
-        default=60,
-        help="Fps of input video"
+        type=float,
+        default=None,
+        help="Fps of input video (default: as stated by the video container, 60 for images)"
+    )
+    parser.add_argument(
+        "--velocitySmoothing",
+        dest="velocitySmoothing",
+        type=Constants.VelocitySmoothing,
+        choices=list(Constants.VelocitySmoothing),
+        default=Constants.VelocitySmoothing.WINDOW,
+        help="Velocity of objects averaged over the last second or exponentially smoothed can be WINDOW or EXPONENTIAL"
+    )
+    parser.add_argument(
+        "--translationEstimator",
+        dest="translationEstimator",
+        type=Constants.TranslationEstimator,
+        choices=list(Constants.TranslationEstimator),
+        default=Constants.TranslationEstimator.MEAN,
+        help="Estimator for the translation of objects from the displacement of their matched keypoints can be MEAN or MEDIAN"
     )
     parser.add_argument(
         "--outputFps",
@@ -116,6 +329,54 @@ if __name__ == "__main__":
         default=10,
         help="Fps for output video"
     )
+    parser.add_argument(
+        "--detectEvery",
+        dest="detectEvery",
+        type=int,
+        default=1,
+        help="Run the detection only on every n-th frame and interpolate the objects in between"
+    )
+    parser.add_argument(
+        "--batchSize",
+        dest="batchSize",
+        type=int,
+        default=1,
+        help="Number of frames that are run through Mask R-CNN at once"
+    )
+    parser.add_argument(
+        "--resizeBackend",
+        dest="resizeBackend",
+        type=Constants.ResizeBackend,
+        choices=list(Constants.ResizeBackend),
+        default=Constants.ResizeBackend.SKIMAGE,
+        help="Library used by Mask R-CNN to resize images and masks can be OPENCV or SKIMAGE"
+    )
+    parser.add_argument(
+        "--noDetectionCache",
+        dest="noDetectionCache",
+        action="store_true",
+        help="Always run the detection instead of reusing results cached on disk by earlier runs"
+    )
+    parser.add_argument(
+        "--undistort",
+        dest="undistort",
+        action="store_true",
+        help="Undistort frames with the calibration data of the camera type"
+    )
+    parser.add_argument(
+        "--decodeThreads",
+        dest="decodeThreads",
+        type=int,
+        default=2,
+        help="Number of threads preparing frames ahead of the detection"
+    )
+    parser.add_argument(
+        "--prefetchFrames",
+        dest="prefetchFrames",
+        type=int,
+        default=8,
+        help="Maximum number of frames that are prepared ahead of the detection"
+    )
 
     args = parser.parse_args()
     print(args)
@@ -124,19 +385,26 @@ if __name__ == "__main__":
     Constants.FROM_SEC_OR_IMAGE = args.from_sec_or_image
     Constants.TO_SEC_OR_IMAGE = args.to_sec_or_image
     Constants.INPUT_DATA_TYPE = args.inputType
+    Constants.VIDEO_READER = args.videoReader
     Constants.INPUT_DIMENSIONS = tuple(args.inputDimensions)
     Constants.VIDEO_SCALE = args.inputScale
-    Constants.MATCHER_TYPE = args.matcherType
     Constants.CAMERA_TYPE = args.cameraType
-    Constants.INPUT_FPS = args.inputFps
+    if args.inputFps is not None:
+        Constants.INPUT_FPS = args.inputFps
+    elif Constants.INPUT_DATA_TYPE == Constants.InputDataType.VIDEO:
+        Constants.INPUT_FPS = get_video_fps(Constants.INPUT_PATH)
+        print(f"Input fps read from video: {Constants.INPUT_FPS:.3f}")
     Constants.OUTPUT_FPS = args.outputFps
+    Constants.VELOCITY_SMOOTHING = args.velocitySmoothing
+    Constants.TRANSLATION_ESTIMATOR = args.translationEstimator
+    Constants.DETECT_EVERY_N_FRAMES = max(1, args.detectEvery)
+    Constants.DETECTION_BATCH_SIZE = max(1, args.batchSize)
+    Constants.RESIZE_BACKEND = args.resizeBackend
+    Constants.USE_DETECTION_CACHE = not args.noDetectionCache
+    Constants.UNDISTORT = args.undistort
+    Constants.DECODE_THREADS = args.decodeThreads
+    Constants.PREFETCH_FRAMES = args.prefetchFrames
 
-    # Constants need to be set before imports so that they are taken into account
-    from data_model.DetectedObjects import DetectedObjects
-    from data_model.ObjectInstance import create_objects
-    from mrcnn import visualize
-    from mrcnn.Mask_R_CNN_COCO import detect
-    from utils.image_utils import save_debug_image, show, prepare_video_output, get_frames
-    from utils.export_utils import write_detected_objects_to_csv
-
-    main()
+    matchers = [MatcherStrategy(matcher_type, args.matcherBackend, args.extractionMode, args.featureBudget, args.maxFeaturesPerFrame,
+                                args.downscaleLargeObjects) for matcher_type in args.matcherType]
+    main(matchers, args.trackingMode)
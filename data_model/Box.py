@@ -1,5 +1,6 @@
 from dataclasses import dataclass
-from Constants import INPUT_DIMENSIONS
+
+import Constants
 
 OUT_OF_FRAME_MARGIN = 5
 
@@ -37,11 +38,17 @@ class Box:
         """
         return int(self.x1 + self.get_width() / 2), int(self.y1 + self.get_height() / 2)
 
+    def moved_by(self, offset_x: int, offset_y: int):
+        """
+        :return: new bounding box of the same size moved by the offset in pixel
+        """
+        return Box(self.x1 + offset_x, self.y1 + offset_y, self.x2 + offset_x, self.y2 + offset_y)
+
     def get_position_in_image(self) -> tuple:
         """
         :return: position of bounding box within the image as (x, y)  each with values in the range of [0, 1]
         """
-        return self.get_center()[0] / INPUT_DIMENSIONS[0], self.get_center()[1] / INPUT_DIMENSIONS[1]
+        return self.get_center()[0] / Constants.INPUT_DIMENSIONS[0], self.get_center()[1] / Constants.INPUT_DIMENSIONS[1]
 
     def out_of_frame_left(self) -> bool:
         """
@@ -53,7 +60,7 @@ class Box:
         """
         :return: boolean whether the bounding box touches the right frame edge (with some margin)
         """
-        return self.x2 > INPUT_DIMENSIONS[0] - OUT_OF_FRAME_MARGIN
+        return self.x2 > Constants.INPUT_DIMENSIONS[0] - OUT_OF_FRAME_MARGIN
 
     def out_of_frame_top(self) -> bool:
         """
@@ -65,4 +72,4 @@ class Box:
         """
         :return: boolean whether the bounding box touches the bottom frame edge (with some margin)
         """
-        return self.y2 > INPUT_DIMENSIONS[1] - OUT_OF_FRAME_MARGIN
+        return self.y2 > Constants.INPUT_DIMENSIONS[1] - OUT_OF_FRAME_MARGIN
@@ -0,0 +1,95 @@
+from dataclasses import dataclass
+from typing import Tuple
+
+import numpy as np
+
+
+@dataclass
+class CompactMask:
+    """
+    Class holding an instance mask cropped to its bounding box instead of spanning the whole frame.
+    y1 = Top edge of the cropped mask within the frame
+    x1 = Left edge of the cropped mask within the frame
+    cropped_mask = boolean mask of the size of the bounding box (height, width)
+    frame_shape = size of the frame (height, width) the mask belongs to
+    """
+
+    y1: int
+    x1: int
+    cropped_mask: np.ndarray
+    frame_shape: Tuple[int, int]
+
+    @staticmethod
+    def from_full_mask(full_mask: np.ndarray, bbox):
+        """
+        :returns a compact mask holding the part of the full frame mask within the bounding box (y1, x1, y2, x2)
+        """
+        y1, x1, y2, x2 = [int(e) for e in bbox]
+        return CompactMask(y1, x1, full_mask[y1:y2, x1:x2].astype(bool), full_mask.shape[:2])
+
+    @staticmethod
+    def from_rle(y1: int, x1: int, shape: Tuple[int, int], runs: np.ndarray, frame_shape: Tuple[int, int]):
+        """
+        :returns a compact mask decoded from its run length encoding (see to_rle)
+        """
+        is_foreground_run = np.arange(len(runs)) % 2 == 1
+        cropped_mask = np.repeat(is_foreground_run, runs).reshape(shape)
+        return CompactMask(y1, x1, cropped_mask, frame_shape)
+
+    def get_y2(self) -> int:
+        """
+        :return: bottom edge of the cropped mask within the frame (exclusive)
+        """
+        return self.y1 + self.cropped_mask.shape[0]
+
+    def get_x2(self) -> int:
+        """
+        :return: right edge of the cropped mask within the frame (exclusive)
+        """
+        return self.x1 + self.cropped_mask.shape[1]
+
+    def get_area(self) -> int:
+        """
+        :return: number of pixels covered by the mask
+        """
+        return int(np.count_nonzero(self.cropped_mask))
+
+    def moved_by(self, offset_x: int, offset_y: int):
+        """
+        :return: new mask of the same shape moved by the offset in pixel
+        """
+        return CompactMask(self.y1 + offset_y, self.x1 + offset_x, self.cropped_mask, self.frame_shape)
+
+    def clip_to_frame(self, frame_shape=None) -> Tuple[Tuple[slice, slice], np.ndarray]:
+        """
+        Clips the mask to the frame, as it might reach over the frame edges after it has been moved.
+        :return: tuple of the (y, x) slices of the frame covered by the mask and the corresponding part of the mask
+        """
+        height, width = (frame_shape or self.frame_shape)[:2]
+        y1, x1 = max(self.y1, 0), max(self.x1, 0)
+        y2, x2 = max(min(self.get_y2(), height), y1), max(min(self.get_x2(), width), x1)
+        mask_part = self.cropped_mask[y1 - self.y1: y2 - self.y1, x1 - self.x1: x2 - self.x1]
+        return (slice(y1, y2), slice(x1, x2)), mask_part
+
+    def to_full_mask(self, frame_shape=None, dtype=np.uint8) -> np.ndarray:
+        """
+        Expands the mask to the size of the whole frame
+        :return: mask of the frame_shape (height, width) with 1 for all pixels covered by the mask
+        """
+        frame_shape = (frame_shape or self.frame_shape)[:2]
+        full_mask = np.zeros(frame_shape, dtype=dtype)
+        frame_slices, mask_part = self.clip_to_frame(frame_shape)
+        full_mask[frame_slices] = mask_part
+        return full_mask
+
+    def to_rle(self) -> np.ndarray:
+        """
+        Run length encoding of the cropped mask in row-major order.
+        :return: lengths of alternating runs of background and foreground pixels, always starting with background
+        """
+        flat_mask = self.cropped_mask.ravel()
+        run_starts = np.flatnonzero(flat_mask[1:] != flat_mask[:-1]) + 1
+        runs = np.diff(np.concatenate(([0], run_starts, [flat_mask.size])))
+        if flat_mask.size > 0 and flat_mask[0]:
+            runs = np.concatenate(([0], runs))
+        return runs
@@ -1,9 +1,23 @@
 from typing import Dict
 
+import cv2
+import numpy as np
+
+from Constants import TrackingMode
+from data_model.ObjectInstance import extract_features
 from data_model.ObjectTrack import ObjectTrack
+from matcher.GatingIndex import GatingIndex
+from matcher.KalmanTracker import KalmanTrackerBank
+from matcher.MatcherStrategy import MatcherStrategy
+from matcher.assignment_utils import assign_by_similarity
+from matcher.optical_flow_utils import get_indices_of_points_in_mask, track_points
 
 SAMENESS_THRESHOLD = 0.3  # 0 = match all, 1 match basically none
 KEEP_TRACK_OF_OBJS_FOR_N_FRAMES = 5
+# Smallest share of the reliably tracked keypoints of an object track that has to lie within a new object
+MIN_SHARE_OF_FLOW_POINTS_IN_MASK = 0.5
+# Smallest number of keypoints that have to be tracked by optical flow, otherwise features are extracted again
+MIN_NUMBER_OF_FLOW_POINTS = 10
 
 
 class DetectedObjects:
@@ -11,9 +25,20 @@ class DetectedObjects:
     Class storing the state of detected objects
     """
 
-    def __init__(self):
+    def __init__(self, matcher: MatcherStrategy, tracking_mode: TrackingMode = TrackingMode.MATCHING):
+        """
+        :param matcher: matcher used to extract and match the features of the objects
+        :param tracking_mode: MATCHING extracts and matches the features of all new objects. OPTICAL_FLOW tracks the
+        keypoints of the object tracks into the new frame and only extracts features of the new objects which can't be
+        associated that way, see add_objects.
+        """
+        self.matcher = matcher
+        self.tracking_mode = tracking_mode
+        self.previous_frame_gray = None  # last frame objects have been added for, only kept for OPTICAL_FLOW
         self.nextObjectID = 0
-        self.objects: Dict[int, ObjectTrack] = dict()
+        self.active_objects: Dict[int, ObjectTrack] = dict()  # object tracks considered for matching
+        self.archived_objects: Dict[int, ObjectTrack] = dict()  # retired object tracks, only kept for exports
+        self.kalman_bank = KalmanTrackerBank()  # Kalman Filters of all object tracks, advanced once per frame
 
     def get_next_id(self) -> int:
         """
@@ -28,70 +53,191 @@ class DetectedObjects:
         :returns object tracks which are marked as active,
         meaning a corresponding object has been found in the last 5 frames.
         """
-        return {key: track for key, track in self.objects.items() if track.active}
+        return dict(self.active_objects)
+
+    def get_all_object_tracks(self) -> Dict[int, ObjectTrack]:
+        """
+        :returns active and archived object tracks ordered by their id
+        """
+        all_object_tracks = {**self.archived_objects, **self.active_objects}
+        return {key: all_object_tracks[key] for key in sorted(all_object_tracks)}
+
+    def get_number_of_object_tracks(self) -> int:
+        """
+        :returns number of object tracks found so far, including archived ones
+        """
+        return len(self.active_objects) + len(self.archived_objects)
 
-    def add_objects(self, new_objects):
+    def add_objects(self, new_objects, frame=None):
         """
         Adds objects found in the current frame to the detected objects.
-        Objects will be added to existing object tracks if found before or a new one will be initialized if the
-        object has been found for the first time.
+        All objects are associated with the active object tracks at once, so that the result doesn't depend on the
+        order of the objects. Objects will be added to their existing object track if found before or a new one will
+        be initialized if the object has been found for the first time.
         Object tracks that were not updated will be marked as such and deactivated if too old.
+        :param frame: current frame, only needed for the tracking mode OPTICAL_FLOW, in which the new objects may come
+        without features (see create_objects)
         """
+        active_object_tracks = self.get_active_object_tracks()
+        obj_ids = list(active_object_tracks.keys())
+        if self.tracking_mode == TrackingMode.OPTICAL_FLOW:
+            frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            assignments = self._assign_by_optical_flow(new_objects, active_object_tracks, frame_gray)
+            self.previous_frame_gray = frame_gray
+        else:
+            assignments = assign_by_similarity(self._get_similarities(new_objects, active_object_tracks), SAMENESS_THRESHOLD)
+
         touched_object_ids = set()
-        for new_obj in new_objects:
-            new_or_added_to_obj_id = self._add_object(new_obj, touched_object_ids)
-            touched_object_ids.add(new_or_added_to_obj_id)
+        for obj_index, new_obj in enumerate(new_objects):
+            if obj_index in assignments:
+                obj_id = obj_ids[assignments[obj_index]]
+                self.active_objects[obj_id].add_occurrence(new_obj)
+            else:
+                obj_id = self._add_new_object_track(new_obj)
+            touched_object_ids.add(obj_id)
 
         # add None to all obj_tracks that have not found a new instance
-        for obj_id, obj_track in self.get_active_object_tracks().items():
+        for obj_id, obj_track in active_object_tracks.items():
             if obj_id not in touched_object_ids:
                 obj_track.add_occurrence(None)
 
+        self.kalman_bank.step()
         self._deactivate_old_object_tracks()
 
-    def _add_object(self, new_obj_instance, already_touched_obj_ids, verbose=False):
+    def interpolate_objects(self):
         """
-        Adds objects found in the current frame to the detected objects.
-        Objects will be added to existing object tracks if found before or a new one will be initialized if the
-        object has been found for the first time.
-        Objects with id in already_touched_obj_ids will be skipped.
+        Advances all active object tracks by one frame for which no detection has been run, based on the predictions
+        of their Kalman Filters. No features are extracted or matched for these frames.
+        """
+        for obj_track in self.get_active_object_tracks().values():
+            obj_track.add_interpolated_occurrence()
+        self.kalman_bank.step()
+
+    def _add_new_object_track(self, new_obj_instance) -> int:
         """
-        if verbose:
-            print(f"\nNew Object: {new_obj_instance.class_name}, {new_obj_instance.roi}")
+        Initializes a new object track for an object that has been found for the first time
+        :return: id of the new object track
+        """
+        new_obj_id = self.get_next_id()
+        self.active_objects[new_obj_id] = ObjectTrack(new_obj_instance, self.matcher, self.kalman_bank)
+        return new_obj_id
 
-        obj_id_with_sufficient_similarity = self._find_existing_matching_obj_track(already_touched_obj_ids, new_obj_instance)
+    def _assign_by_optical_flow(self, new_objects, object_tracks: Dict[int, ObjectTrack], frame_gray) -> Dict[int, int]:
+        """
+        Tracks the keypoints of the object tracks found in the previous frame into the current frame with optical flow
+        and associates the new objects by the share of these keypoints within their masks. The tracked keypoints become
+        the features of the associated objects and their flow vectors the point correspondences of the translation,
+        so that no features have to be extracted or matched for them. Only the remaining new objects and those with
+        too few tracked keypoints get features extracted, the remaining ones are then associated by matching.
+        :returns dict of the index of a new object to the index of the object track it is assigned to
+        """
+        obj_ids = list(object_tracks.keys())
+        flows = self._get_optical_flows(object_tracks, frame_gray)
+        flow_similarities = np.zeros((len(new_objects), len(object_tracks)))
+        for track_index, obj_id in enumerate(obj_ids):
+            if obj_id not in flows:
+                continue
+            _, _, tracked_points = flows[obj_id]
+            for obj_index, new_obj in enumerate(new_objects):
+                if new_obj.class_name == object_tracks[obj_id].class_name:
+                    flow_similarities[obj_index, track_index] = len(get_indices_of_points_in_mask(tracked_points, new_obj.mask)) / len(tracked_points)
+        assignments = assign_by_similarity(flow_similarities, MIN_SHARE_OF_FLOW_POINTS_IN_MASK)
 
-        if obj_id_with_sufficient_similarity:
-            # Add to existing object
-            obj_with_highest_similarity = self.objects[obj_id_with_sufficient_similarity]
-            obj_with_highest_similarity.add_occurrence(new_obj_instance)
-            return obj_id_with_sufficient_similarity
-        else:
-            # Add as new object
-            new_obj_track = ObjectTrack(new_obj_instance)
-            new_obj_id = self.get_next_id()
-            self.objects[new_obj_id] = new_obj_track
-            return new_obj_id
-
-    def _find_existing_matching_obj_track(self, already_touched_obj_ids, new_obj_instance):
-        """
-        Find object id of object that most closely matches new_obj_instance while not being in already_touched_obj_ids
-        """
-        obj_id_with_sufficient_similarity = None
-        highest_similarity = 0
-        for obj_id, obj_track in self.get_active_object_tracks().items():
-            if obj_id not in already_touched_obj_ids:
-                similarity_to_current_obj = obj_track.similarity_to(new_obj_instance, over_n_instances=KEEP_TRACK_OF_OBJS_FOR_N_FRAMES)
-                if similarity_to_current_obj > highest_similarity:
-                    highest_similarity = similarity_to_current_obj
-                    if similarity_to_current_obj > SAMENESS_THRESHOLD:
-                        obj_id_with_sufficient_similarity = obj_id
-        return obj_id_with_sufficient_similarity
+        objects_without_features = []
+        for obj_index, track_index in assignments.items():
+            new_obj = new_objects[obj_index]
+            obj_track = object_tracks[obj_ids[track_index]]
+            last_instance, indices, tracked_points = flows[obj_ids[track_index]]
+            in_mask = get_indices_of_points_in_mask(tracked_points, new_obj.mask)
+            indices, tracked_points = indices[in_mask], tracked_points[in_mask]
+            # The flow vectors are cached as correspondences, which are looked up for the translation of the object
+            obj_track.match_cache.put("correspondences", new_obj, last_instance, (tracked_points, last_instance.keypoint_positions[indices]))
+            if len(indices) < MIN_NUMBER_OF_FLOW_POINTS:
+                objects_without_features.append(new_obj)
+            elif new_obj.descriptors is None:
+                new_obj.keypoints = last_instance.keypoints[indices]
+                new_obj.keypoints["pt"] = tracked_points
+                new_obj.descriptors = last_instance.descriptors[indices]  # extracted in the previous frame
+
+        unassigned_obj_indices = [i for i in range(len(new_objects)) if i not in assignments]
+        objects_without_features += [new_objects[i] for i in unassigned_obj_indices if new_objects[i].descriptors is None]
+        if objects_without_features:
+            extract_features(objects_without_features, frame_gray, self.matcher)
+
+        # Objects which couldn't be associated by optical flow are matched with the remaining object tracks
+        assigned_track_indices = set(assignments.values())
+        remaining_track_indices = [i for i in range(len(obj_ids)) if i not in assigned_track_indices]
+        remaining_object_tracks = {obj_ids[i]: object_tracks[obj_ids[i]] for i in remaining_track_indices}
+        remaining_objects = [new_objects[i] for i in unassigned_obj_indices]
+        similarities = self._get_similarities(remaining_objects, remaining_object_tracks)
+        for obj_index, track_index in assign_by_similarity(similarities, SAMENESS_THRESHOLD).items():
+            assignments[unassigned_obj_indices[obj_index]] = remaining_track_indices[track_index]
+        return assignments
+
+    def _get_optical_flows(self, object_tracks: Dict[int, ObjectTrack], frame_gray) -> dict:
+        """
+        Tracks the keypoints of all object tracks found in the previous frame into the current frame at once.
+        :returns dict of the object id to a tuple of the instance in the previous frame, the indices of its reliably
+        tracked keypoints and their (N, 2) positions in the current frame. Object tracks with less than
+        MIN_NUMBER_OF_FLOW_POINTS reliably tracked keypoints are left out.
+        """
+        if self.previous_frame_gray is None:
+            return {}
+        last_instances = {}
+        for obj_id, obj_track in object_tracks.items():
+            last_detected_occurrences = obj_track.get_last_detected_occurrences(1)
+            if last_detected_occurrences and last_detected_occurrences[0] is not None and len(last_detected_occurrences[0].keypoints) >= MIN_NUMBER_OF_FLOW_POINTS:
+                last_instances[obj_id] = last_detected_occurrences[0]
+        if not last_instances:
+            return {}
+
+        points = np.concatenate([instance.keypoint_positions for instance in last_instances.values()])
+        tracked_points, reliable = track_points(self.previous_frame_gray, frame_gray, points)
+        flows = {}
+        start = 0
+        for obj_id, instance in last_instances.items():
+            end = start + len(instance.keypoints)
+            indices = np.flatnonzero(reliable[start:end])
+            if len(indices) >= MIN_NUMBER_OF_FLOW_POINTS:
+                flows[obj_id] = (instance, indices, tracked_points[start:end][indices])
+            start = end
+        return flows
+
+    def _get_similarities(self, new_objects, object_tracks: Dict[int, ObjectTrack]) -> np.ndarray:
+        """
+        Computes the similarity of every new object to every object track exactly once. Only object tracks of the same
+        class whose area predicted by the Kalman Filter contains the new object are looked at, all other pairs keep a
+        similarity of 0. Each new object is matched against all of its candidate object tracks in a single call.
+        :return: matrix of shape (number of new objects, number of object tracks)
+        """
+        similarities = np.zeros((len(new_objects), len(object_tracks)))
+        track_indices = {obj_id: track_index for track_index, obj_id in enumerate(object_tracks.keys())}
+        gating_index = GatingIndex.from_object_tracks(object_tracks)
+        for obj_index, new_obj in enumerate(new_objects):
+            uncached_candidates = []
+            for obj_id in gating_index.get_candidates(new_obj.class_name, new_obj.roi.get_center()):
+                obj_track = object_tracks[obj_id]
+                reference_instance = obj_track.get_reference_instance_for(new_obj, over_n_instances=KEEP_TRACK_OF_OBJS_FOR_N_FRAMES)
+                if reference_instance is None:
+                    continue
+                if obj_track.match_cache.contains("similarity", reference_instance, new_obj):
+                    similarities[obj_index, track_indices[obj_id]] = obj_track.match_cache.get("similarity", reference_instance, new_obj)
+                else:
+                    uncached_candidates.append((obj_id, reference_instance))
+
+            reference_instances = [reference_instance for _, reference_instance in uncached_candidates]
+            for (obj_id, reference_instance), similarity in zip(uncached_candidates, new_obj.similarities_of(reference_instances, self.matcher)):
+                object_tracks[obj_id].match_cache.put("similarity", reference_instance, new_obj, similarity)
+                similarities[obj_index, track_indices[obj_id]] = similarity
+        return similarities
 
     def _deactivate_old_object_tracks(self):
         """
-        Marks objects as deactivated if the object hasn't been found in KEEP_TRACK_OF_OBJS_FOR_N_FRAMES frames
+        Marks objects as deactivated if the object hasn't been found in the last KEEP_TRACK_OF_OBJS_FOR_N_FRAMES frames
+        in which a detection has been run and moves them to the archive. Interpolated frames in between don't count.
         """
-        obj_tracks_to_deactivate = [obj_track for key, obj_track in self.get_active_object_tracks().items() if not obj_track.was_present_in_last_n_frames(KEEP_TRACK_OF_OBJS_FOR_N_FRAMES)]
-        for track in obj_tracks_to_deactivate:
-            track.active = False
+        obj_ids_to_deactivate = [key for key, obj_track in self.active_objects.items() if not obj_track.was_detected_in_last_n_detections(KEEP_TRACK_OF_OBJS_FOR_N_FRAMES)]
+        for obj_id in obj_ids_to_deactivate:
+            track = self.active_objects.pop(obj_id)
+            track.retire()
+            self.archived_objects[obj_id] = track
@@ -0,0 +1,18 @@
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+
+@dataclass
+class Frame:
+    """
+    Class holding a single frame of the input together with its position in the input.
+    number = index of the frame counted from the first processed frame
+    image = color correct (BGR) image data
+    timestamp = second within the video at which the frame is shown (None for images)
+    """
+
+    number: int
+    image: np.ndarray
+    timestamp: Optional[float] = None
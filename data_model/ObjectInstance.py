@@ -4,20 +4,16 @@ from typing import Tuple, Optional
 
 import cv2
 import numpy as np
-from cv2.cv2 import KeyPoint
 
-from Constants import MATCHER_TYPE, MatcherType, CAMERA_TYPE, VIDEO_SCALE
+import Constants
+from Constants import ExtractionMode, FeatureBudget
 from mrcnn.CocoClasses import get_class_name_for_id, get_dimensions
 
-# Specifies which matcher will be used
-if MATCHER_TYPE == MatcherType.SIFT:
-    from matcher.SiftMatcher import average_descriptor_distance, get_keypoints_and_descriptors_for_object
-elif MATCHER_TYPE == MatcherType.SURF:
-    from matcher.SurfMatcher import average_descriptor_distance, get_keypoints_and_descriptors_for_object
-else:
-    from matcher.OrbMatcher import average_descriptor_distance, get_keypoints_and_descriptors_for_object
-
 from data_model.Box import Box
+from data_model.CompactMask import CompactMask
+from matcher.MatcherStrategy import MatcherStrategy
+from matcher.extraction_utils import get_extraction_scale, get_feature_budgets
+from matcher.keypoint_utils import empty_keypoints
 from utils.timer import timing
 
 
@@ -33,13 +29,22 @@ class ObjectInstance:
     translation_to_last_instance: Optional[Tuple[float, float, float]]
     velocity: Optional[Tuple[float, float, float]]
     speed: Optional[float]
-    mask: [[]]
-    keypoints: [KeyPoint] = field(default_factory=list)
+    mask: Optional[CompactMask]
+    keypoints: np.ndarray = field(default_factory=empty_keypoints)  # structured array, see matcher.keypoint_utils
     descriptors: np.ndarray = None
+    interpolated: bool = False  # True if not detected but predicted for a frame in between key frames
+
+    @property
+    def keypoint_positions(self) -> np.ndarray:
+        """
+        :returns (N, 2) float32 positions (x, y) of the keypoints
+        """
+        return self.keypoints["pt"]
 
-    def similarity_to(self, obj_instance) -> float:
+    def similarity_to(self, obj_instance, matcher: MatcherStrategy) -> float:
         """
-        :returns value in range of [0, 1] whether this object is similar to the incoming obj_instance.
+        :returns value in range of [0, 1] whether this object is similar to the incoming obj_instance, according to
+        the matcher that extracted the descriptors of both.
         0 => Not similar
         1 => Very similar
         """
@@ -47,13 +52,44 @@ class ObjectInstance:
         if self.descriptors is None or obj_instance.descriptors is None:
             return 0
         # Check if descriptors match
-        average_distance = average_descriptor_distance(self.descriptors, obj_instance.descriptors)
+        average_distance = matcher.average_descriptor_distance(self.descriptors, obj_instance.descriptors)
         return max(0.0, 1 - average_distance)
 
+    def similarities_of(self, obj_instances, matcher: MatcherStrategy) -> [float]:
+        """
+        Batched version of similarity_to: the similarity of each of the obj_instances to this object instance (as in
+        obj_instance.similarity_to(self, matcher)), computed with a single match call for all of them.
+        :returns values in range of [0, 1] in the order of obj_instances
+        """
+        similarities = [0.0] * len(obj_instances)
+        if self.descriptors is None:
+            return similarities
+        indices_with_descriptors = [i for i, obj_instance in enumerate(obj_instances) if obj_instance.descriptors is not None]
+        average_distances = matcher.average_descriptor_distances([obj_instances[i].descriptors for i in indices_with_descriptors], self.descriptors)
+        for i, average_distance in zip(indices_with_descriptors, average_distances):
+            similarities[i] = max(0.0, 1 - average_distance)
+        return similarities
+
+    def interpolated_at(self, center: Tuple[int, int]):
+        """
+        :returns an interpolated copy of this instance moved to the given center.
+        The copy carries no features, as no detection has been run for it.
+        """
+        offset_x = center[0] - self.roi.get_center()[0]
+        offset_y = center[1] - self.roi.get_center()[1]
+        return ObjectInstance(self.class_name,
+                              self.roi.moved_by(offset_x, offset_y),
+                              self.confidence_score,
+                              translation_to_last_instance=None,
+                              velocity=self.velocity,
+                              speed=self.speed,
+                              mask=None if self.mask is None else self.mask.moved_by(offset_x, offset_y),
+                              interpolated=True)
+
     def approximate_distance(self) -> float:
         """:returns rough estimation of distance to the object in meters"""
         rl_dim_x, rl_dim_y = get_dimensions(self.class_name)
-        lens_factor = CAMERA_TYPE.value[0] * VIDEO_SCALE
+        lens_factor = Constants.CAMERA_TYPE.value[0] * Constants.VIDEO_SCALE
         bbox = self.roi
         if bbox.out_of_frame_left() or bbox.out_of_frame_right():
             # bbox goes out of frame horizontally
@@ -81,8 +117,8 @@ class ObjectInstance:
         z: negative is behind the camera (should never happen), positive is straight into the picture
         """
         distance = self.approximate_distance()
-        angle_x_degree = (self.roi.get_position_in_image()[0] - 0.5) * CAMERA_TYPE.value[1]
-        angle_y_degree = (self.roi.get_position_in_image()[1] - 0.5) * CAMERA_TYPE.value[2]
+        angle_x_degree = (self.roi.get_position_in_image()[0] - 0.5) * Constants.CAMERA_TYPE.value[1]
+        angle_y_degree = (self.roi.get_position_in_image()[1] - 0.5) * Constants.CAMERA_TYPE.value[2]
         angle_x_radian = angle_x_degree * math.pi / 180 + math.pi / 2
         angle_y_radian = angle_y_degree * math.pi / 180 + math.pi / 2
         x = -(distance * math.sin(angle_y_radian) * math.cos(angle_x_radian))
@@ -98,16 +134,15 @@ class ObjectInstance:
 
 
 @timing
-def create_objects(result, frame) -> [ObjectInstance]:
+def create_objects(result, frame, matcher: MatcherStrategy, with_features: bool = True) -> [ObjectInstance]:
     """
     Generates list of ObjectInstances from the results obtained by Mask R-CNN and the current frame.
+    Features are extracted with the given matcher, unless with_features is False. Then they are left to be extracted
+    later on with extract_features, e.g. only for objects which can't be tracked by optical flow.
     """
     objects = []
     number_of_results = result["class_ids"].shape[0]
 
-    # Convert frame to grayscale for matchers
-    frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
     for i in range(number_of_results):
 
         confidence_score = result["scores"][i]
@@ -117,19 +152,44 @@ def create_objects(result, frame) -> [ObjectInstance]:
         y1, x1, y2, x2 = roi
         box = Box(x1, y1, x2, y2)
 
-        mask = result["masks"][:, :, i].astype(np.uint8)
+        mask = result["masks"][i]
 
-        keypoints, descriptors = get_keypoints_and_descriptors_for_object(frame_gray, mask)
-        # show(drawKeypoints(frame, keypoints, None))
         detected_object = ObjectInstance(class_name,
                                          box,
                                          confidence_score,
                                          translation_to_last_instance=None,
                                          velocity=None,
                                          speed=None,
-                                         mask=mask,
-                                         keypoints=keypoints,
-                                         descriptors=descriptors)
+                                         mask=mask)
         objects.append(detected_object)
 
+    if with_features:
+        # Convert frame to grayscale for matchers
+        extract_features(objects, cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), matcher)
     return objects
+
+
+def extract_features(objects: [ObjectInstance], frame_gray, matcher: MatcherStrategy):
+    """
+    Extracts the keypoints and descriptors of the objects within their masks in the grayscale frame with the given
+    matcher and its extraction settings and stores them in the objects.
+    """
+    masks = [obj.mask for obj in objects]
+    if matcher.feature_budget == FeatureBudget.ADAPTIVE:
+        feature_budgets = get_feature_budgets(masks, matcher.max_features_per_frame)
+    else:
+        feature_budgets = None  # default of the matcher
+
+    if matcher.extraction_mode == ExtractionMode.PER_FRAME:
+        features_per_object = matcher.get_keypoints_and_descriptors_for_objects(frame_gray, masks, feature_budgets)
+
+    for i, obj in enumerate(objects):
+        if matcher.extraction_mode == ExtractionMode.PER_FRAME:
+            keypoints, descriptors = features_per_object[i]
+        else:
+            max_features = None if feature_budgets is None else feature_budgets[i]
+            scale = get_extraction_scale(obj.mask) if matcher.downscale_large_objects else 1.0
+            keypoints, descriptors = matcher.get_keypoints_and_descriptors_for_object(frame_gray, obj.mask, max_features, scale)
+        # show(drawKeypoints(frame, to_cv_keypoints(keypoints), None))
+        obj.keypoints = keypoints
+        obj.descriptors = descriptors
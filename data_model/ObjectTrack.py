@@ -1,20 +1,39 @@
 import math
 import operator
-from typing import Optional, Tuple
+from collections import deque
+from itertools import islice
+from typing import Deque, Optional, Tuple
 
-from Constants import MATCHER_TYPE, MatcherType, INPUT_FPS, CAMERA_TYPE, VIDEO_SCALE
-from matcher.KalmanTracker import KalmanTracker
-from mrcnn.CocoClasses import is_static
+import numpy as np
 
-# Specifies which matcher will be used
-if MATCHER_TYPE == MatcherType.SIFT:
-    from matcher.SiftMatcher import get_matches
-elif MATCHER_TYPE == MatcherType.SURF:
-    from matcher.SurfMatcher import get_matches
-else:
-    from matcher.OrbMatcher import get_matches
+import Constants
+from Constants import TranslationEstimator
+from matcher.KalmanTracker import KalmanTracker, KalmanTrackerBank
+from matcher.MatchCache import MatchCache
+from matcher.MatcherStrategy import MatcherStrategy
+from mrcnn.CocoClasses import is_static
 
 from data_model.ObjectInstance import ObjectInstance
+from data_model.OccurrenceRecord import OccurrenceRecord
+from data_model.VelocityAccumulator import VelocityAccumulator
+
+# Largest number of detected occurrences looked back on (similarity, trajectory)
+LOOK_BACK_N_DETECTIONS = 5
+
+
+def get_occurrence_buffer_size() -> int:
+    """
+    :returns number of most recent occurrences that are kept with all their data (mask, keypoints, descriptors). Covers
+    the last detected occurrences including the interpolated ones in between.
+    """
+    return (LOOK_BACK_N_DETECTIONS + 1) * Constants.DETECT_EVERY_N_FRAMES + 1
+
+
+def get_velocity_window_size() -> int:
+    """
+    :returns number of occurrences the velocity is averaged over (one second)
+    """
+    return round(Constants.INPUT_FPS)
 
 
 class ObjectTrack:
@@ -22,10 +41,22 @@ class ObjectTrack:
     Class which holds all instances of an object found throughout a video
     """
 
-    def __init__(self, first_obj_occurrence: ObjectInstance):
-        self.occurrences: [Optional[ObjectInstance]] = [first_obj_occurrence]
+    def __init__(self, first_obj_occurrence: ObjectInstance, matcher: MatcherStrategy, kalman_bank: Optional[KalmanTrackerBank] = None):
+        """
+        :param first_obj_occurrence: instance the object has been found as for the first time
+        :param matcher: matcher that extracted the features of the occurrences, used to match them
+        :param kalman_bank: bank shared by all object tracks whose Kalman Filters are advanced together
+        """
+        self.occurrences: Deque[Optional[ObjectInstance]] = deque([first_obj_occurrence], maxlen=get_occurrence_buffer_size())
+        # Occurrences of the frames in which a detection has been run, without the interpolated frames in between
+        self.detected_occurrences: Deque[Optional[ObjectInstance]] = deque([first_obj_occurrence], maxlen=LOOK_BACK_N_DETECTIONS)
+        self.history: [Optional[OccurrenceRecord]] = [OccurrenceRecord.from_instance(first_obj_occurrence)]  # of all occurrences
         x, y = first_obj_occurrence.roi.get_center()
-        self.kalman_tracker: KalmanTracker = KalmanTracker(x, y)
+        self.kalman_tracker: KalmanTracker = KalmanTracker(x, y, kalman_bank)
+        self.velocity_accumulator = VelocityAccumulator(get_velocity_window_size(), Constants.INPUT_FPS, Constants.VELOCITY_SMOOTHING)
+        self.velocity_accumulator.add(None)
+        self.matcher = matcher
+        self.match_cache = MatchCache(max_size=4 * LOOK_BACK_N_DETECTIONS)  # matches between the recent occurrences
         self.class_name: str = first_obj_occurrence.class_name
         self.active = True  # Boolean whether this object is considered for matching or not
 
@@ -35,14 +66,60 @@ class ObjectTrack:
         current frame.
         """
         self.occurrences.append(new_obj_instance)
+        self.detected_occurrences.append(new_obj_instance)
         center_or_none = None if new_obj_instance is None else new_obj_instance.roi.get_center()
         self.kalman_tracker.update(center_or_none)
         if self.is_present():
             self.get_current_instance().translation_to_last_instance = self.get_translation_to_last_instance()
+            self.velocity_accumulator.add(self.get_current_instance().translation_to_last_instance)
             velocity = self.get_velocity()
             speed = self.calculate_speed_from_velocity(velocity)
             self.get_current_instance().velocity = velocity
             self.get_current_instance().speed = speed
+        else:
+            self.velocity_accumulator.add(None)
+        self._add_to_history(self.get_current_instance())
+
+    def add_interpolated_occurrence(self):
+        """
+        Advances the object track by one frame for which no detection has been run.
+        If the object is currently present, it is moved to the position predicted by the Kalman Filter and added as
+        interpolated occurrence, otherwise None is added.
+        """
+        current_instance = self.get_current_instance()
+        if current_instance is None:
+            self.occurrences.append(None)
+        else:
+            self.occurrences.append(current_instance.interpolated_at(self.get_next_position_prediction()))
+        self.kalman_tracker.update(None)
+        self.velocity_accumulator.add(None)  # interpolated occurrences have no translation
+        self._add_to_history(self.get_current_instance())
+
+    def retire(self):
+        """
+        Deactivates this object track for good. Only the lightweight history is kept, the occurrences with their
+        masks, keypoints and descriptors as well as the slot of the Kalman Filter are released.
+        """
+        self.active = False
+        self.kalman_tracker.detach()
+        self.occurrences.clear()
+        self.detected_occurrences.clear()
+        self.match_cache.clear()
+
+    def _add_to_history(self, instance_or_none: Optional[ObjectInstance]):
+        self.history.append(None if instance_or_none is None else OccurrenceRecord.from_instance(instance_or_none))
+
+    def get_number_of_occurrences(self) -> int:
+        """
+        :returns number of frames this object has been tracked for, including those it wasn't found in
+        """
+        return len(self.history)
+
+    def get_last_occurrences(self, n: int) -> [Optional[ObjectInstance]]:
+        """
+        :returns the last (max) n occurrences, n has to be within get_occurrence_buffer_size()
+        """
+        return list(islice(self.occurrences, max(0, len(self.occurrences) - n), None))
 
     def get_next_position_prediction(self):
         """
@@ -74,9 +151,20 @@ class ObjectTrack:
 
     def was_present_in_last_n_frames(self, n=5) -> bool:
         """Bool whether object was present in the last n frames at least once"""
-        last_n_occurrences = self.occurrences[-n:]
+        last_n_occurrences = self.get_last_occurrences(n)
         return any(last_n_occurrences)  # checks if any is not None
 
+    def was_detected_in_last_n_detections(self, n=5) -> bool:
+        """Bool whether object was found at least once in the last n frames in which a detection has been run"""
+        return any(self.get_last_detected_occurrences(n))  # checks if any is not None
+
+    def get_last_detected_occurrences(self, n=5) -> [Optional[ObjectInstance]]:
+        """
+        :returns the last (max) n occurrences of frames in which a detection has been run, skipping interpolated ones.
+        n has to be within LOOK_BACK_N_DETECTIONS
+        """
+        return list(islice(self.detected_occurrences, max(0, len(self.detected_occurrences) - n), None))
+
     def get_current_instance(self) -> ObjectInstance:
         """
         :return: current instance if present, else None
@@ -89,18 +177,29 @@ class ObjectTrack:
         0 => Not similar
         1 => Very similar
         """
+        reference_instance = self.get_reference_instance_for(obj_instance, over_n_instances)
+        if reference_instance is None:
+            return 0
+        return self.match_cache.get_or_compute("similarity", reference_instance, obj_instance, lambda: reference_instance.similarity_to(obj_instance, self.matcher))
+
+    def get_reference_instance_for(self, obj_instance: ObjectInstance, over_n_instances: int = 5) -> Optional[ObjectInstance]:
+        """
+        :returns the latest detected occurrence within the last over_n_instances detections, which the incoming
+        obj_instance has to be compared to, or None if the obj_instance can't be this object (different class, outside
+        of the predicted area or no recent occurrence)
+        """
         # Check if same class
         if not self.class_name == obj_instance.class_name:
-            return 0
+            return None
         # Check if location checks out
         if not self.kalman_tracker.is_point_in_predicted_area(obj_instance.roi.get_center()):
-            return 0
-        last_n_occurrences = self.occurrences[-over_n_instances:]
+            return None
+        last_n_occurrences = self.get_last_detected_occurrences(over_n_instances)
         for occurrence in reversed(last_n_occurrences):
             if occurrence is not None:
-                return occurrence.similarity_to(obj_instance)
+                return occurrence
         # Object did not appear in last 5 frames
-        return 0
+        return None
 
     def is_static(self):
         """
@@ -108,32 +207,26 @@ class ObjectTrack:
         """
         return is_static(self.class_name)
 
-    def get_velocity(self, over_n_instances: int = INPUT_FPS):
+    def get_velocity(self):
         """
-        Calculates the velocity for the axis x, y, and z in m/s
+        Calculates the velocity for the axis x, y, and z in m/s, averaged over the last get_velocity_window_size()
+        occurrences (or exponentially smoothed, see Constants.VELOCITY_SMOOTHING)
         Returns None if object did not appear in the current frame
         """
         if not self.active or not self.is_present():
             return None
         else:
-            last_n_occurrences = self.occurrences[-over_n_instances:]  # Getting last (max) n occurrences of this object
-            last_n_occurrences_filtered = [x for x in last_n_occurrences if x is not None]  # Filtering for non None values
-            last_translations = list(map(lambda x: x.translation_to_last_instance, last_n_occurrences_filtered))  # mapping to positions of this object
-            last_translations_filtered = [x for x in last_translations if x is not None]  # Filtering for non None values
-            cumulative_translation = tuple(map(sum, zip(*last_translations_filtered)))  # Adding up all the differences
-            smoothed_translation = tuple(map(lambda x: x / (len(last_n_occurrences) - 1), cumulative_translation))  # dividing by number of instances / frames since first appearance
-            translation_in_meter_per_second = tuple(map(lambda x: x * INPUT_FPS, smoothed_translation))  # Multiplying by fps to get m/s
-            return translation_in_meter_per_second
+            return self.velocity_accumulator.get_velocity()
 
     def calculate_speed_from_velocity(self, velocity) -> Optional[float]:
         """Returns the current estimated speed in km/h if a velocity could be calculated beforehand, else None"""
         return None if velocity is None else math.sqrt(sum([e ** 2 for e in velocity])) * 3.6
 
     def get_previous_present_instance(self) -> Optional[ObjectInstance]:
-        """Returns the last present occurrence or None if there was none"""
-        all_but_current_instance = list(reversed(self.occurrences[:-1]))
+        """Returns the last present and detected (not interpolated) occurrence or None if there was none"""
+        all_but_current_instance = islice(reversed(self.occurrences), 1, None)
         for instance in all_but_current_instance:
-            if instance is not None:
+            if instance is not None and not instance.interpolated:
                 return instance
 
     def get_translation_to_last_instance(self) -> Optional[Tuple[float, float, float]]:
@@ -145,19 +238,9 @@ class ObjectTrack:
             current_instance = self.get_current_instance()
             previous_instance = self.get_previous_present_instance()
 
-            if current_instance is not None and current_instance.descriptors is not None and previous_instance is not None and previous_instance.descriptors is not None:
-                matches = get_matches(current_instance.descriptors, previous_instance.descriptors)
-                if matches:  # one or more matches
-                    cumulative_2d_translation_in_px = (0, 0)
-                    for match in matches:
-                        kp_idx_current = match.queryIdx
-                        kp_idx_last = match.trainIdx
-                        key_point_current = current_instance.keypoints[kp_idx_current].pt
-                        key_point_last = previous_instance.keypoints[kp_idx_last].pt
-                        translation = tuple(map(operator.sub, key_point_current, key_point_last))  # subtract current point from last one
-                        cumulative_2d_translation_in_px = tuple(map(operator.add, cumulative_2d_translation_in_px, translation))  # add them up
-                    average_2d_translation_in_px = tuple(map(lambda e: e / len(matches), cumulative_2d_translation_in_px))  # div by length
-
+            if current_instance is not None and previous_instance is not None:
+                average_2d_translation_in_px = self._get_average_2d_translation(current_instance, previous_instance)
+                if average_2d_translation_in_px is not None:  # one or more matches
                     current_distance = current_instance.approximate_distance()
                     previous_distance = previous_instance.approximate_distance()
                     z = current_distance - previous_distance
@@ -166,11 +249,40 @@ class ObjectTrack:
 
                     return x, y, z
 
+    def _get_average_2d_translation(self, current: ObjectInstance, last: ObjectInstance) -> Optional[Tuple[float, float]]:
+        """
+        :returns average translation (x, y) in pixel of the matched keypoints from the last to the current instance or
+        None if there are no matches
+        """
+        points_current, points_last = self._get_point_correspondences(current, last)
+        if len(points_current) == 0:
+            return None
+        translations = points_current - points_last
+        if Constants.TRANSLATION_ESTIMATOR == TranslationEstimator.MEDIAN:
+            # Robust against single wrong matches
+            return tuple(np.median(translations, axis=0).astype(np.float64))
+        return tuple(np.mean(translations, axis=0, dtype=np.float64))
+
+    def _get_point_correspondences(self, current: ObjectInstance, last: ObjectInstance) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Matches the keypoints of two instances, each pair only once as long as it is cached.
+        :returns positions (N, 2) of the matched keypoints in the current and in the last instance
+        """
+        def match():
+            if current.descriptors is None or last.descriptors is None:
+                return np.empty((0, 2), dtype=np.float32), np.empty((0, 2), dtype=np.float32)
+            matches = self.matcher.get_matches(current.descriptors, last.descriptors)
+            query_indices = np.fromiter((match.queryIdx for match in matches), dtype=np.intp, count=len(matches))
+            train_indices = np.fromiter((match.trainIdx for match in matches), dtype=np.intp, count=len(matches))
+            return current.keypoint_positions[query_indices], last.keypoint_positions[train_indices]
+
+        return self.match_cache.get_or_compute("correspondences", current, last, match)
+
     def _pixel_to_meter(self, pixel: float, at_distance: float) -> float:
         """
         Calculates for a given number of pixels to how many meters they correspond at a given distance.
         """
-        pixel_per_meter_at_1_m = 100 * CAMERA_TYPE.value[0] * VIDEO_SCALE
+        pixel_per_meter_at_1_m = 100 * Constants.CAMERA_TYPE.value[0] * Constants.VIDEO_SCALE
         pixel_per_meter_at_distance = pixel_per_meter_at_1_m / at_distance
         meter = pixel / pixel_per_meter_at_distance
         return meter
@@ -180,24 +292,17 @@ class ObjectTrack:
         Returns tuple (x,y) of how the object (or rather its matched keypoints) moved on average over the last n frames
         """
         if len(self.occurrences) >= 2:
-            last_n_instances = list(reversed(self.occurrences[-over_n_instances:]))
+            last_n_instances = list(reversed(self.get_last_detected_occurrences(over_n_instances)))
             smoothed_translation = (0.0, 0.0)
             for i in range(len(last_n_instances) - 1):
                 current = last_n_instances[i]
                 last = last_n_instances[i + 1]
 
                 cumulative_translation = (0, 0)
-                if current is not None and current.descriptors is not None and last is not None and last.descriptors is not None:
-                    matches = get_matches(current.descriptors, last.descriptors)
-                    if matches:  # one or more matches
-                        for match in matches:
-                            kp_idx_current = match.queryIdx
-                            kp_idx_last = match.trainIdx
-                            key_point_current = current.keypoints[kp_idx_current].pt
-                            key_point_last = last.keypoints[kp_idx_last].pt
-                            translation = tuple(map(operator.sub, key_point_current, key_point_last))  # subtract current point from last one
-                            cumulative_translation = tuple(map(operator.add, cumulative_translation, translation))  # add them up
-                        cumulative_translation = tuple(map(lambda x: x / len(matches), cumulative_translation))  # div by length
+                if current is not None and last is not None:
+                    average_translation = self._get_average_2d_translation(current, last)
+                    if average_translation is not None:  # one or more matches
+                        cumulative_translation = average_translation
 
                 decayed_translation = tuple(map(lambda x: x / (i + 1), cumulative_translation))  # decay: less impact for older instances
                 smoothed_translation = tuple(map(operator.add, smoothed_translation, decayed_translation))  # add them up
@@ -207,7 +312,7 @@ class ObjectTrack:
 
     def __str__(self):
         return (
-            f"{len(self.occurrences)} occurrences, "
+            f"{self.get_number_of_occurrences()} occurrences, "
             f"current instance: {self.get_current_instance()}, "
             f"present in last 5 frames: {self.was_present_in_last_n_frames(5)}, "
             f"next predicted pos: {self.get_next_position_prediction()}, "
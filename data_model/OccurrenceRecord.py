@@ -0,0 +1,35 @@
+from dataclasses import dataclass
+from typing import Tuple, Optional
+
+from data_model.Box import Box
+
+
+@dataclass
+class OccurrenceRecord:
+    """
+    Class holding the lightweight summary of an object occurrence that is kept for the whole run (e.g. for exports),
+    while the full ObjectInstance with mask, keypoints and descriptors is only kept for the most recent frames.
+    """
+
+    roi: Box
+    confidence_score: float
+    distance: float
+    position_3d: Tuple[float, float, float]
+    velocity: Optional[Tuple[float, float, float]]
+    speed: Optional[float]
+    number_of_keypoints: Optional[int]
+    interpolated: bool
+
+    @staticmethod
+    def from_instance(obj_instance):
+        """
+        :returns the summary of an ObjectInstance
+        """
+        return OccurrenceRecord(obj_instance.roi,
+                                obj_instance.confidence_score,
+                                obj_instance.approximate_distance(),
+                                obj_instance.get_3d_position(),
+                                obj_instance.velocity,
+                                obj_instance.speed,
+                                None if obj_instance.keypoints is None else len(obj_instance.keypoints),
+                                obj_instance.interpolated)
@@ -0,0 +1,70 @@
+from typing import Optional, Tuple
+
+from Constants import VelocitySmoothing
+
+
+class VelocityAccumulator:
+    """
+    Class computing the velocity of an object track from the translations between its occurrences in constant time
+    per frame.
+    WINDOW: Average translation over the last window_size occurrences (including those without a translation), kept
+    as running sum over a ring buffer.
+    EXPONENTIAL: Exponential moving average of the translations with the smoothing factor of an equally long window.
+    A translation covers all frames since the last translation (e.g. interpolated frames or frames without the object),
+    so it is divided by their number before it is averaged.
+    """
+
+    def __init__(self, window_size: int, fps: float, smoothing: VelocitySmoothing = VelocitySmoothing.WINDOW):
+        self.window_size = max(1, window_size)
+        self.fps = fps
+        self.smoothing = smoothing
+        self.alpha = 2 / (self.window_size + 1)  # smoothing factor of the exponential moving average
+        self.translations: [Optional[Tuple[float, float, float]]] = [None] * self.window_size  # ring buffer
+        self.next_index = 0
+        self.number_of_occurrences = 0
+        self.translation_sum = [0.0, 0.0, 0.0]
+        self.number_of_translations = 0  # translations within the window that are not None
+        self.moving_average: Optional[Tuple[float, float, float]] = None
+        self.frames_without_translation = -1  # since the last translation, the first occurrence is where it starts
+
+    def add(self, translation_or_none: Optional[Tuple[float, float, float]]):
+        """
+        Adds the translation of the latest occurrence or None if there is none (e.g. object not found)
+        """
+        if self.smoothing == VelocitySmoothing.EXPONENTIAL:
+            if translation_or_none is None:
+                self.frames_without_translation += 1
+            else:
+                number_of_frames = max(1, self.frames_without_translation + 1)
+                self.frames_without_translation = 0
+                velocity = tuple(e / number_of_frames * self.fps for e in translation_or_none)
+                if self.moving_average is None:
+                    self.moving_average = velocity
+                else:
+                    self.moving_average = tuple(self.alpha * v + (1 - self.alpha) * a for v, a in zip(velocity, self.moving_average))
+            return
+
+        dropped_translation = self.translations[self.next_index]
+        if dropped_translation is not None:
+            self.translation_sum = [s - e for s, e in zip(self.translation_sum, dropped_translation)]
+            self.number_of_translations -= 1
+        if translation_or_none is not None:
+            self.translation_sum = [s + e for s, e in zip(self.translation_sum, translation_or_none)]
+            self.number_of_translations += 1
+        self.translations[self.next_index] = translation_or_none
+        self.number_of_occurrences += 1
+        self.next_index = (self.next_index + 1) % self.window_size
+        if self.next_index == 0:
+            # Sum up again once per window, so that rounding errors of the running sum don't accumulate
+            self.translation_sum = [sum(e) for e in zip(*[t for t in self.translations if t is not None], (0.0, 0.0, 0.0))]
+
+    def get_velocity(self) -> tuple:
+        """
+        :returns the velocity for the axis x, y, and z in m/s or an empty tuple if no translation is known yet
+        """
+        if self.smoothing == VelocitySmoothing.EXPONENTIAL:
+            return () if self.moving_average is None else self.moving_average
+        if self.number_of_translations == 0:
+            return ()
+        number_of_frames = max(1, min(self.number_of_occurrences, self.window_size) - 1)  # frames since first appearance
+        return tuple(e / number_of_frames * self.fps for e in self.translation_sum)
@@ -0,0 +1,74 @@
+import cv2
+
+from Constants import MatcherBackend
+from matcher.binary_descriptor_utils import average_binary_descriptor_distances, get_binary_matches
+from matcher.extraction_utils import detect_and_compute_in_bbox, detect_and_compute_in_masks
+from matcher.flann_utils import FlannIndexCache, LSH_INDEX_PARAMS
+from utils.timer import timing
+
+BRISK = cv2.BRISK_create()
+# Measured on the true matches between consecutive frames of the sample video (utils/MatcherBenchmark.py --calibrate):
+# up to MAX_MATCH_DISTANCE, the same share of true matches is kept as by ORB and DISTANCE_NORMALIZATION leads to the
+# same mean similarity of consecutive instances of an object as with ORB
+MAX_MATCH_DISTANCE = 61
+DISTANCE_NORMALIZATION = 285
+# BRISK drops keypoints whose sampling pattern (which grows with the scale of the keypoint) leaves the image, so more is
+# cropped around the object than for SIFT
+CROP_MARGIN = 64
+
+# LSH indexes of the descriptors of recent object instances, reused as long as the instances are matched against
+FLANN_INDEXES = FlannIndexCache(LSH_INDEX_PARAMS)
+
+
+@timing
+def get_matches(descriptor_a, descriptor_b, max_distance=MAX_MATCH_DISTANCE, backend: MatcherBackend = MatcherBackend.BRUTE_FORCE):
+    """
+    Calculates matches between descriptors a and b.
+    Only return matches with a maximum distance of max_distance.
+    """
+    return get_binary_matches(descriptor_a, descriptor_b, max_distance, FLANN_INDEXES, backend)
+
+
+@timing
+def average_descriptor_distance(descriptor_a, descriptor_b, backend: MatcherBackend = MatcherBackend.BRUTE_FORCE) -> float:
+    """
+    Calculates the average distance between matched keypoints.
+    The result is scaled so that is comparable between SIFT, SURF, ORB, AKAZE and BRISK.
+    This way it returns a number between 0 and 1 for each matcher.
+    100 is returned in case less than 10% of the keypoints match to signal "no match".
+    """
+    return average_descriptor_distances([descriptor_a], descriptor_b, backend)[0]
+
+
+@timing
+def average_descriptor_distances(descriptors_a: list, descriptor_b, backend: MatcherBackend = MatcherBackend.BRUTE_FORCE) -> [float]:
+    """
+    Calculates average_descriptor_distance(descriptor_a, descriptor_b) for every descriptor_a in descriptors_a with a
+    single match call, see average_binary_descriptor_distances.
+    """
+    return average_binary_descriptor_distances(descriptors_a, descriptor_b, DISTANCE_NORMALIZATION, FLANN_INDEXES, backend)
+
+
+@timing
+def get_keypoints_and_descriptors_for_object(grayscale_image, mask, max_features=None, scale=1.0):
+    """
+    Detect BRISK features and compute descriptors within the bounding box of the object.
+    :param grayscale_image: whole image as grayscale
+    :param mask: CompactMask of the object that restricts the area in which to search for keypoints
+    :param max_features: number of keypoints to keep (all if None)
+    :param scale: level of the image pyramid the features are extracted on (e.g. 0.5 for half the size)
+    :return:
+    """
+    return detect_and_compute_in_bbox(BRISK, grayscale_image, mask, CROP_MARGIN, max_features, scale)
+
+
+@timing
+def get_keypoints_and_descriptors_for_objects(grayscale_image, masks, max_features_per_mask=None):
+    """
+    Detect BRISK features and compute descriptors once for all objects of the frame.
+    :param grayscale_image: whole image as grayscale
+    :param masks: CompactMasks of all objects of the frame
+    :param max_features_per_mask: number of keypoints to keep for all or for every mask (all if None)
+    :return: list with a tuple of keypoints and descriptors for every mask
+    """
+    return detect_and_compute_in_masks(BRISK, grayscale_image, masks, CROP_MARGIN, max_features_per_mask)
@@ -0,0 +1,56 @@
+from collections import defaultdict
+from math import floor
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from matcher.KalmanTracker import get_max_uncertainty
+
+
+class GatingIndex:
+    """
+    Uniform grid over the gates of object tracks, bucketed by class.
+    A gate is the area span up by the next position prediction of a track plus its uncertainty (see
+    KalmanTracker.is_point_in_predicted_area). As gates are at most get_max_uncertainty() wide and high, every gate covers
+    at most four cells of the default size, so a lookup only has to test the few gates around a point.
+    """
+
+    def __init__(self, cell_size: Optional[float] = None):
+        self.cell_size = max(1.0, get_max_uncertainty() if cell_size is None else cell_size)
+        self.gates: Dict[Hashable, Tuple[int, int, int, int]] = dict()  # key -> (x, y, cov_x, cov_y)
+        self.cells: Dict[Tuple[str, int, int], List[Hashable]] = defaultdict(list)
+
+    @staticmethod
+    def from_object_tracks(object_tracks: dict, cell_size: Optional[float] = None):
+        """
+        :param object_tracks: dict of ObjectTracks by key (e.g. their id)
+        :return: index over the gates of the object tracks for the next frame
+        """
+        index = GatingIndex(cell_size)
+        for key, obj_track in object_tracks.items():
+            index.add(key, obj_track.class_name, obj_track.get_next_position_prediction(), obj_track.get_next_position_uncertainty())
+        return index
+
+    def add(self, key: Hashable, class_name: str, position: Tuple[int, int], uncertainty: Tuple[int, int]):
+        """
+        Adds the gate of a track with the given key
+        """
+        x, y = position
+        cov_x, cov_y = uncertainty
+        self.gates[key] = (x, y, cov_x, cov_y)
+        for cell_x in range(self._cell(x - cov_x / 2), self._cell(x + cov_x / 2) + 1):
+            for cell_y in range(self._cell(y - cov_y / 2), self._cell(y + cov_y / 2) + 1):
+                self.cells[(class_name, cell_x, cell_y)].append(key)
+
+    def get_candidates(self, class_name: str, point: Tuple[float, float]) -> List[Hashable]:
+        """
+        :returns keys of all tracks of the class whose gate contains the point
+        """
+        p_x, p_y = point
+        candidates = []
+        for key in self.cells.get((class_name, self._cell(p_x), self._cell(p_y)), []):
+            x, y, cov_x, cov_y = self.gates[key]
+            if x - cov_x / 2 < p_x < x + cov_x / 2 and y - cov_y / 2 < p_y < y + cov_y / 2:
+                candidates.append(key)
+        return candidates
+
+    def _cell(self, coordinate: float) -> int:
+        return floor(coordinate / self.cell_size)
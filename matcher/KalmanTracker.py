@@ -2,80 +2,221 @@ from typing import Tuple
 
 import numpy as np
 from filterpy.common import Q_discrete_white_noise
-from filterpy.kalman import KalmanFilter
 
 import Constants
-
-MAX_UNCERTAINTY = Constants.INPUT_DIMENSIONS[0] / 5
+from utils.timer import timing
+
+DT = 1.0
+STATE_TRANSITION = np.array(
+    [
+        [1.0, 0.0, DT, 0.0, DT ** 2 / 2, 0.0],  # pos.x, pos.y, vel.x, vel.y, acc.x, acc.y
+        [0.0, 1.0, 0.0, DT, 0.0, DT ** 2 / 2],
+        [0.0, 0.0, 1.0, 0.0, DT, 0.0],
+        [0.0, 0.0, 0.0, 1.0, 0.0, DT],
+        [0.0, 0.0, 0.0, 0.0, 1.0, 0.0],
+        [0.0, 0.0, 0.0, 0.0, 0.0, 1.0],
+    ]
+)  # state transition matrix
+MEASUREMENT_FUNCTION = np.array([[1., 0, 0, 0, 0, 0],  # pos.x, pos.y, vel.x, vel.y, acc.x, acc.y
+                                 [0., 1, 0, 0, 0, 0]])
+PROCESS_UNCERTAINTY = Q_discrete_white_noise(2, dt=DT, var=0.1, block_size=3, order_by_dim=False)
+
+
+def get_max_uncertainty() -> float:
+    """
+    :returns largest position uncertainty in pixel, relative to the input dimensions
+    """
+    return Constants.INPUT_DIMENSIONS[0] / 5
 
 
-class KalmanTracker:
+class KalmanTrackerBank:
     """
-    Kalman Filter of the second degree
+    Kalman Filters of the second degree for many objects at once.
+    The states (T, 6) and covariances (T, 6, 6) of all filters are stacked, so that the update > prediction cycle of
+    all objects of a frame is done with a few matrix operations instead of one small filter per object.
+    Every filter occupies one slot, slots of filters that are no longer needed are reused.
     """
 
-    def __init__(self, initial_pos_x=0, initial_pos_y=0):
-        self.kf = KalmanFilter(dim_x=6, dim_z=2)
+    def __init__(self, capacity=64):
+        capacity = max(1, capacity)
+        self.x = np.zeros((capacity, 6))  # states
+        self.P = np.zeros((capacity, 6, 6))  # covariance matrices
+        self.last_position_prediction = np.zeros((capacity, 2))
+        self.last_position_uncertainty = np.zeros((capacity, 2))
+        self.measurements = np.zeros((capacity, 2))
+        self.has_measurement = np.zeros(capacity, dtype=bool)
+        self.pending = np.zeros(capacity, dtype=bool)  # Filters which wait for the next cycle
+        self.free_slots = list(reversed(range(capacity)))
+        # Relative to the input dimensions, which are set before the first bank is created
+        self.initial_covariance = np.eye(6) * Constants.INPUT_DIMENSIONS[0] / 5
+        self.measurement_uncertainty = np.eye(2) * Constants.INPUT_DIMENSIONS[0] / 30
+        self.max_uncertainty = get_max_uncertainty()
+
+    def allocate(self, initial_pos_x=0, initial_pos_y=0) -> int:
+        """
+        Initializes a new filter at the given position
+        :return: slot of the new filter
+        """
+        if not self.free_slots:
+            self._grow()
+        slot = self.free_slots.pop()
+        self.x[slot] = (initial_pos_x, initial_pos_y, 0.0, 0.0, 0.0, 0.0)
+        self.P[slot] = self.initial_covariance
+        self.last_position_prediction[slot] = 0
+        self.last_position_uncertainty[slot] = 0
+        self.has_measurement[slot] = False
+        self.pending[slot] = False
+        return slot
+
+    def free(self, slot: int):
+        """
+        Releases the slot of a filter that is not needed anymore, so that it can be reused
+        """
+        self.pending[slot] = False
+        self.free_slots.append(slot)
+
+    def schedule_update(self, slot: int, center_or_none):
+        """
+        Registers the filter in the slot for the next update > prediction cycle, with or without a new measurement.
+        A filter that is already waiting for a cycle is advanced first.
+        """
+        if self.pending[slot]:
+            self.step()
+        self.pending[slot] = True
+        self.has_measurement[slot] = bool(center_or_none)
+        if center_or_none:
+            self.measurements[slot] = center_or_none
+
+    def ensure_stepped(self, slot: int):
+        """
+        Advances all waiting filters if the filter in the slot is one of them, so that its state is up to date
+        """
+        if self.pending[slot]:
+            self.step()
 
-        self.kf.x = np.array([[initial_pos_x, initial_pos_y, 0.0, 0.0, 0.0, 0.0]], np.float32).T  # state
+    @timing
+    def step(self):
+        """
+        Performs the update > prediction cycle for all waiting filters at once.
+        The update step gets skipped for filters without a new measurement.
+        """
+        slots = np.flatnonzero(self.pending)
+        if len(slots) == 0:
+            return
+        x = self.x[slots]
+        P = self.P[slots]
+        self.last_position_prediction[slots] = x[:, :2]
+        self.last_position_uncertainty[slots] = np.diagonal(P, axis1=1, axis2=2)[:, :2]
+
+        measured = self.has_measurement[slots]
+        if np.any(measured):
+            x[measured], P[measured] = self._update(x[measured], P[measured], self.measurements[slots[measured]])
+
+        # Predict
+        self.x[slots] = x @ STATE_TRANSITION.T
+        self.P[slots] = STATE_TRANSITION @ P @ STATE_TRANSITION.T + PROCESS_UNCERTAINTY
+        self.pending[slots] = False
+        self.has_measurement[slots] = False
+
+    def _update(self, x, P, z):
+        """
+        Update step of a stack of filters with their measurements z (n, 2), using the Joseph form for the covariance
+        """
+        residual = z - x @ MEASUREMENT_FUNCTION.T
+        PHT = P @ MEASUREMENT_FUNCTION.T  # (n, 6, 2)
+        S = MEASUREMENT_FUNCTION @ PHT + self.measurement_uncertainty  # system uncertainty (n, 2, 2)
+        K = PHT @ np.linalg.inv(S)  # Kalman gain (n, 6, 2)
+        x = x + np.einsum("nij,nj->ni", K, residual)
+        I_KH = np.eye(6) - K @ MEASUREMENT_FUNCTION
+        P = I_KH @ P @ I_KH.transpose(0, 2, 1) + K @ self.measurement_uncertainty @ K.transpose(0, 2, 1)
+        return x, P
+
+    def _grow(self):
+        """
+        Doubles the number of slots
+        """
+        capacity = len(self.x)
+        self.x = np.concatenate((self.x, np.zeros_like(self.x)))
+        self.P = np.concatenate((self.P, np.zeros_like(self.P)))
+        self.last_position_prediction = np.concatenate((self.last_position_prediction, np.zeros_like(self.last_position_prediction)))
+        self.last_position_uncertainty = np.concatenate((self.last_position_uncertainty, np.zeros_like(self.last_position_uncertainty)))
+        self.measurements = np.concatenate((self.measurements, np.zeros_like(self.measurements)))
+        self.has_measurement = np.concatenate((self.has_measurement, np.zeros_like(self.has_measurement)))
+        self.pending = np.concatenate((self.pending, np.zeros_like(self.pending)))
+        self.free_slots = list(reversed(range(capacity, 2 * capacity))) + self.free_slots
 
-        dt = 1.0
-        self.kf.F = np.array(
-            [
-                [1.0, 0.0, dt, 0.0, dt ** 2 / 2, 0.0],  # pos.x, pos.y, vel.x, vel.y, acc.x, acc.y
-                [0.0, 1.0, 0.0, dt, 0.0, dt ** 2 / 2],
-                [0.0, 0.0, 1.0, 0.0, dt, 0.0],
-                [0.0, 0.0, 0.0, 1.0, 0.0, dt],
-                [0.0, 0.0, 0.0, 0.0, 1.0, 0.0],
-                [0.0, 0.0, 0.0, 0.0, 0.0, 1.0],
-            ]
-        )  # state transition matrix
 
-        self.kf.H = np.array([[1., 0, 0, 0, 0, 0],  # pos.x, pos.y, vel.x, vel.y, acc.x, acc.y
-                              [0., 1, 0, 0, 0, 0]])  # Measurement function
+class KalmanTracker:
+    """
+    Kalman Filter of the second degree for a single object.
+    The filter lives in a slot of a KalmanTrackerBank. If the bank is shared between objects, updates are collected
+    and computed for all objects at once when the bank is stepped (or when the state of this filter is read).
+    Without a shared bank, the filter has a bank of its own and is updated immediately.
+    """
 
-        self.kf.P *= Constants.INPUT_DIMENSIONS[0] / 5  # covariance matrix
-        self.kf.R = np.eye(2) * Constants.INPUT_DIMENSIONS[0] / 30  # measurement uncertainty
-        self.kf.Q = Q_discrete_white_noise(2, dt=dt, var=0.1, block_size=3, order_by_dim=False)  # process uncertainty
-        self.last_position_prediction = (0, 0)
-        self.last_position_uncertainty = (0, 0)
+    def __init__(self, initial_pos_x=0, initial_pos_y=0, bank: KalmanTrackerBank = None):
+        self.steps_itself = bank is None
+        self.bank = KalmanTrackerBank(capacity=1) if bank is None else bank
+        self.slot = self.bank.allocate(initial_pos_x, initial_pos_y)
 
     def update(self, center_or_none):
         """
         Performs the update > prediction cycle of the Kalman Filter.
         If no new measurement is provided, the update step gets skipped.
         """
-        self.last_position_prediction = self.next_position_prediction()
-        self.last_position_uncertainty = self.next_position_uncertainty()
-        if center_or_none:
-            self.kf.update(center_or_none)
-        self.kf.predict()
+        self.bank.schedule_update(self.slot, center_or_none)
+        if self.steps_itself:
+            self.bank.step()
+
+    def detach(self):
+        """
+        Moves the filter out of a shared bank into a bank of its own, so that its slot can be reused by other objects
+        """
+        if self.steps_itself:
+            return
+        self.bank.ensure_stepped(self.slot)
+        own_bank = KalmanTrackerBank(capacity=1)
+        own_bank.x[0] = self.bank.x[self.slot]
+        own_bank.P[0] = self.bank.P[self.slot]
+        own_bank.last_position_prediction[0] = self.bank.last_position_prediction[self.slot]
+        own_bank.last_position_uncertainty[0] = self.bank.last_position_uncertainty[self.slot]
+        own_bank.free_slots = []
+        self.bank.free(self.slot)
+        self.bank = own_bank
+        self.slot = 0
+        self.steps_itself = True
 
     def next_position_prediction(self) -> Tuple[int, int]:
         """
         This function returns the estimated the position of the object in the next time step
         """
-        return int(self.kf.x[0][0]), int(self.kf.x[1][0])
+        self.bank.ensure_stepped(self.slot)
+        x = self.bank.x[self.slot]
+        return int(x[0]), int(x[1])
 
     def current_position_prediction(self) -> Tuple[int, int]:
         """
         This function returns the estimated the position of the object for the current time step (last prediction)
         """
-        return self.last_position_prediction
+        self.bank.ensure_stepped(self.slot)
+        x, y = self.bank.last_position_prediction[self.slot]
+        return int(x), int(y)
 
     def next_position_uncertainty(self) -> Tuple[int, int]:
         """
         Returns a tuple with uncertainty in x and y direction
         """
-        covariance_matrix = self.kf.P
-        covariances = np.diag(covariance_matrix)  # pos.x, pos.y, vel.x, vel.y, acc.x, acc.y
-        return int(min(covariances[0], MAX_UNCERTAINTY)), int(min(covariances[1], MAX_UNCERTAINTY))
+        self.bank.ensure_stepped(self.slot)
+        covariance_matrix = self.bank.P[self.slot]
+        return int(min(covariance_matrix[0, 0], self.bank.max_uncertainty)), int(min(covariance_matrix[1, 1], self.bank.max_uncertainty))
 
     def current_position_uncertainty(self) -> Tuple[int, int]:
         """
         Returns a tuple with uncertainty in x and y direction for the current time step (last prediction)
         """
-        return self.last_position_uncertainty
+        self.bank.ensure_stepped(self.slot)
+        cov_x, cov_y = np.minimum(self.bank.last_position_uncertainty[self.slot], self.bank.max_uncertainty)
+        return int(cov_x), int(cov_y)
 
     def is_point_in_predicted_area(self, point: Tuple[float, float]) -> bool:
         """
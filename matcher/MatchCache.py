@@ -0,0 +1,48 @@
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class MatchCache:
+    """
+    LRU cache of results of matching two object instances, keyed by the identity of the instances and the kind of
+    result (e.g. point correspondences or similarity). Entries hold references to their instances, so that the ids of
+    cached instances can't be reused by new instances.
+    """
+
+    def __init__(self, max_size: int = 16):
+        self.max_size = max(1, max_size)
+        self.entries: OrderedDict = OrderedDict()  # (kind, id a, id b) -> (instance a, instance b, result)
+
+    def get_or_compute(self, kind: Hashable, instance_a, instance_b, compute: Callable[[], Any]) -> Any:
+        """
+        :returns the cached result for the pair of instances or the result of compute(), which is then cached
+        """
+        if self.contains(kind, instance_a, instance_b):
+            return self.get(kind, instance_a, instance_b)
+        result = compute()
+        self.put(kind, instance_a, instance_b, result)
+        return result
+
+    def contains(self, kind: Hashable, instance_a, instance_b) -> bool:
+        return (kind, id(instance_a), id(instance_b)) in self.entries
+
+    def get(self, kind: Hashable, instance_a, instance_b) -> Any:
+        """
+        :returns the cached result for the pair of instances, which has to be contained
+        """
+        key = (kind, id(instance_a), id(instance_b))
+        self.entries.move_to_end(key)
+        return self.entries[key][2]
+
+    def put(self, kind: Hashable, instance_a, instance_b, result: Any):
+        """
+        Caches the result for the pair of instances and evicts the least recently used entry if the cache is full
+        """
+        key = (kind, id(instance_a), id(instance_b))
+        self.entries[key] = (instance_a, instance_b, result)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
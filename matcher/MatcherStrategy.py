@@ -0,0 +1,78 @@
+import importlib
+
+from Constants import ExtractionMode, FeatureBudget, MatcherBackend, MatcherType
+
+# Module implementing the matcher functions of every matcher type. Modules are imported when they are first used, so
+# that e.g. SURF is only required if it is selected.
+MATCHER_MODULES = {
+    MatcherType.SIFT: "matcher.SiftMatcher",
+    MatcherType.SURF: "matcher.SurfMatcher",
+    MatcherType.ORB: "matcher.OrbMatcher",
+    MatcherType.AKAZE: "matcher.AkazeMatcher",
+    MatcherType.BRISK: "matcher.BriskMatcher",
+}
+
+
+class MatcherStrategy:
+    """
+    Feature extraction and descriptor matching of one matcher type and backend.
+    It is held by DetectedObjects and passed down to its object tracks and instances, so that several pipelines with
+    different matchers can run side by side in one process.
+    """
+
+    def __init__(self, matcher_type: MatcherType, backend: MatcherBackend = MatcherBackend.BRUTE_FORCE,
+                 extraction_mode: ExtractionMode = ExtractionMode.PER_OBJECT, feature_budget: FeatureBudget = FeatureBudget.FIXED,
+                 max_features_per_frame: int = 4000, downscale_large_objects: bool = False):
+        """
+        :param backend: matches descriptors exhaustively (BRUTE_FORCE) or approximately (FLANN)
+        :param extraction_mode: extracts the features once per object (PER_OBJECT) or once per frame for all objects
+        (PER_FRAME), see data_model.ObjectInstance.extract_features
+        :param feature_budget: number of keypoints per object fixed by the matcher (FIXED) or shared out among the
+        objects of a frame by their mask area (ADAPTIVE)
+        :param max_features_per_frame: number of keypoints of all objects of a frame with the ADAPTIVE feature budget
+        :param downscale_large_objects: whether features of large objects are extracted on a coarser pyramid level
+        """
+        self.matcher_type = matcher_type
+        self.backend = backend
+        self.extraction_mode = extraction_mode
+        self.feature_budget = feature_budget
+        self.max_features_per_frame = max_features_per_frame
+        self.downscale_large_objects = downscale_large_objects
+        self.module = importlib.import_module(MATCHER_MODULES[matcher_type])
+
+    def get_keypoints_and_descriptors_for_object(self, grayscale_image, mask, max_features=None, scale=1.0):
+        """
+        :returns tuple of keypoints and descriptors of the object within its mask, up to max_features keypoints
+        (default of the matcher if None) extracted on the pyramid level of the given scale
+        """
+        return self.module.get_keypoints_and_descriptors_for_object(grayscale_image, mask, max_features, scale)
+
+    def get_keypoints_and_descriptors_for_objects(self, grayscale_image, masks, max_features_per_mask=None):
+        """
+        :returns list with a tuple of keypoints and descriptors for every mask, extracted once for the whole frame, up
+        to max_features_per_mask keypoints for all or for every mask (default of the matcher if None)
+        """
+        return self.module.get_keypoints_and_descriptors_for_objects(grayscale_image, masks, max_features_per_mask)
+
+    def get_matches(self, descriptor_a, descriptor_b, max_distance=None):
+        """
+        :returns matches between descriptors a and b up to max_distance (default of the matcher if None)
+        """
+        if max_distance is None:
+            return self.module.get_matches(descriptor_a, descriptor_b, backend=self.backend)
+        return self.module.get_matches(descriptor_a, descriptor_b, max_distance, self.backend)
+
+    def average_descriptor_distance(self, descriptor_a, descriptor_b) -> float:
+        """
+        :returns average distance between matched keypoints scaled to [0, 1] or 100 for "no match"
+        """
+        return self.module.average_descriptor_distance(descriptor_a, descriptor_b, self.backend)
+
+    def average_descriptor_distances(self, descriptors_a: list, descriptor_b) -> [float]:
+        """
+        :returns average_descriptor_distance(descriptor_a, descriptor_b) for every descriptor_a in descriptors_a
+        """
+        return self.module.average_descriptor_distances(descriptors_a, descriptor_b, self.backend)
+
+    def __str__(self):
+        return str(self.matcher_type)
@@ -1,54 +1,85 @@
+from math import ceil
+
 import cv2
 
+from Constants import MatcherBackend
+from matcher.binary_descriptor_utils import average_binary_descriptor_distances, get_binary_matches
+from matcher.extraction_utils import detect_and_compute_in_bbox, detect_and_compute_in_masks
+from matcher.flann_utils import FlannIndexCache, LSH_INDEX_PARAMS
 from utils.timer import timing
 
 MAX_FEATURES = 500
 ORB = cv2.ORB_create(MAX_FEATURES)
+# ORB keeps the strongest keypoints of the whole detection run, which would starve weakly textured objects when all
+# objects of a frame share one run. Hence (practically) all keypoints are kept and the budget is applied per object,
+# which is also used for budgets other than MAX_FEATURES.
+MAX_CANDIDATES_PER_FRAME = 100000
+ORB_PER_FRAME = cv2.ORB_create(MAX_CANDIDATES_PER_FRAME)
+# ORB ignores keypoints closer than its edge threshold to the image border on every pyramid level. Cropping that much
+# more around the object keeps the keypoints of the coarsest level as well.
+CROP_MARGIN = ceil(ORB.getEdgeThreshold() * ORB.getScaleFactor() ** (ORB.getNLevels() - 1))
+# Matches are kept up to a Hamming distance of 30 and average distances are divided by 100 to be comparable to SIFT
+# and SURF. The distances of the other binary matchers are measured relative to these.
+MAX_MATCH_DISTANCE = 30
+DISTANCE_NORMALIZATION = 100
 
-SIMPLE_DESCRIPTOR_MATCHER = cv2.DescriptorMatcher_create(cv2.DESCRIPTOR_MATCHER_BRUTEFORCE_HAMMING)
-
-# Makes sure matches match both ways: min(desc_a, desc_b)
-CROSS_CHECK_DESCRIPTOR_MATCHER = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+# LSH indexes of the descriptors of recent object instances, reused as long as the instances are matched against
+FLANN_INDEXES = FlannIndexCache(LSH_INDEX_PARAMS)
 
 
 @timing
-def get_matches(descriptor_a, descriptor_b, max_distance=30):
+def get_matches(descriptor_a, descriptor_b, max_distance=MAX_MATCH_DISTANCE, backend: MatcherBackend = MatcherBackend.BRUTE_FORCE):
     """
     Calculates matches between descriptors a and b.
     Only return matches with a maximum distance of max_distance.
     """
-    matches = CROSS_CHECK_DESCRIPTOR_MATCHER.match(descriptor_a, descriptor_b, None)
-    filtered_matches = list(filter(lambda m: m.distance <= max_distance, matches))
-    return filtered_matches
+    return get_binary_matches(descriptor_a, descriptor_b, max_distance, FLANN_INDEXES, backend)
 
 
 @timing
-def average_descriptor_distance(descriptor_a, descriptor_b) -> float:
+def average_descriptor_distance(descriptor_a, descriptor_b, backend: MatcherBackend = MatcherBackend.BRUTE_FORCE) -> float:
     """
     Calculates the average distance between matched keypoints.
-    The result is scaled so that is comparable between SIFT, SURF and ORB.
+    The result is scaled so that is comparable between SIFT, SURF, ORB, AKAZE and BRISK.
     This way it returns a number between 0 and 1 for each matcher.
     100 is returned in case less than 10% of the keypoints match to signal "no match".
     """
-    matches = SIMPLE_DESCRIPTOR_MATCHER.match(descriptor_a, descriptor_b, None)
+    return average_descriptor_distances([descriptor_a], descriptor_b, backend)[0]
+
 
-    avg_number_of_descriptors = (len(descriptor_a) + len(descriptor_b)) / 2
-    percent_of_matches = len(matches) / avg_number_of_descriptors
-    if percent_of_matches < 0.1:
-        return 100  # Less than 10% matches -> No Similarity
-    # sum distances
-    total_distance = sum([d.distance for d in matches])
-    # divide by number of matches
-    avg_distance = total_distance / len(matches) / 100
-    return avg_distance
+@timing
+def average_descriptor_distances(descriptors_a: list, descriptor_b, backend: MatcherBackend = MatcherBackend.BRUTE_FORCE) -> [float]:
+    """
+    Calculates average_descriptor_distance(descriptor_a, descriptor_b) for every descriptor_a in descriptors_a with a
+    single match call, see average_binary_descriptor_distances.
+    """
+    return average_binary_descriptor_distances(descriptors_a, descriptor_b, DISTANCE_NORMALIZATION, FLANN_INDEXES, backend)
 
 
 @timing
-def get_keypoints_and_descriptors_for_object(grayscale_image, mask):
+def get_keypoints_and_descriptors_for_object(grayscale_image, mask, max_features=None, scale=1.0):
     """
-    Detect ORB features and compute descriptors.
+    Detect ORB features and compute descriptors within the bounding box of the object.
     :param grayscale_image: whole image as grayscale
-    :param mask: search mask that restricts the area in which to search for keypoints
+    :param mask: CompactMask of the object that restricts the area in which to search for keypoints
+    :param max_features: number of keypoints to keep (MAX_FEATURES if None)
+    :param scale: level of the image pyramid the features are extracted on (e.g. 0.5 for half the size)
     :return:
     """
-    return ORB.detectAndCompute(grayscale_image, mask)
+    if max_features is None:
+        return detect_and_compute_in_bbox(ORB, grayscale_image, mask, CROP_MARGIN, scale=scale)
+    return detect_and_compute_in_bbox(ORB_PER_FRAME, grayscale_image, mask, CROP_MARGIN, max_features, scale)
+
+
+@timing
+def get_keypoints_and_descriptors_for_objects(grayscale_image, masks, max_features_per_mask=None):
+    """
+    Detect ORB features and compute descriptors once for all objects of the frame.
+    :param grayscale_image: whole image as grayscale
+    :param masks: CompactMasks of all objects of the frame
+    :param max_features_per_mask: number of keypoints to keep for all or for every mask (MAX_FEATURES if None)
+    :return: list with a tuple of keypoints and descriptors for every mask
+    """
+    if max_features_per_mask is None:
+        max_features_per_mask = MAX_FEATURES
+    return detect_and_compute_in_masks(ORB_PER_FRAME, grayscale_image, masks, CROP_MARGIN, max_features_per_mask)
@@ -1,5 +1,10 @@
 import cv2
+import numpy as np
 
+from Constants import MatcherBackend
+from matcher.batch_utils import stack_descriptors, sum_per_segment
+from matcher.extraction_utils import CROP_MARGIN, detect_and_compute_in_bbox, detect_and_compute_in_masks
+from matcher.flann_utils import FlannIndexCache, KDTREE_INDEX_PARAMS, knn_match
 from utils.timer import timing
 
 SIFT = cv2.xfeatures2d.SIFT_create()
@@ -8,53 +13,84 @@ MIN_NUMBER_OF_MATCHES = 2
 
 KNN_DESCRIPTOR_MATCHER = cv2.DescriptorMatcher_create(cv2.DescriptorMatcher_BRUTEFORCE)
 
+# Randomized KD-tree indexes of the descriptors of recent object instances, reused as long as the instances are matched against
+FLANN_INDEXES = FlannIndexCache(KDTREE_INDEX_PARAMS)
+
 
 @timing
-def get_matches(descriptor_a, descriptor_b, max_distance=500):
+def get_matches(descriptor_a, descriptor_b, max_distance=500, backend: MatcherBackend = MatcherBackend.BRUTE_FORCE):
     """
     Calculates matches between descriptors a and b.
     Only return matches with a maximum distance of max_distance.
     Lowe's ratio test is applied.
     """
-    matches = _get_matches(descriptor_a, descriptor_b)
+    if backend == MatcherBackend.FLANN:
+        if len(descriptor_b) < MIN_NUMBER_OF_MATCHES:
+            return []
+        matches = [m for m in map(_ratio_test, knn_match(FLANN_INDEXES, descriptor_a, descriptor_b, MIN_NUMBER_OF_MATCHES)) if m is not None]
+    else:
+        matches = _get_matches(descriptor_a, descriptor_b)
     filtered_matches = list(filter(lambda m: m.distance <= max_distance, matches))
     return filtered_matches
 
 
 @timing
-def average_descriptor_distance(descriptor_a, descriptor_b) -> float:
+def average_descriptor_distance(descriptor_a, descriptor_b, backend: MatcherBackend = MatcherBackend.BRUTE_FORCE) -> float:
     """
     Calculates the average distance between matched keypoints.
-    The result is scaled so that is comparable between SIFT, SURF and ORB.
+    The result is scaled so that is comparable between SIFT, SURF, ORB, AKAZE and BRISK.
     This way it returns a number between 0 and 1 for each matcher.
     100 is returned in case less than 10% of the keypoints match to signal "no match".
     """
+    return average_descriptor_distances([descriptor_a], descriptor_b, backend)[0]
+
+
+@timing
+def average_descriptor_distances(descriptors_a: list, descriptor_b, backend: MatcherBackend = MatcherBackend.BRUTE_FORCE) -> [float]:
+    """
+    Calculates average_descriptor_distance(descriptor_a, descriptor_b) for every descriptor_a in descriptors_a with a
+    single knn match call: descriptors_a are stacked and matched against descriptor_b at once, the matches are split
+    back by their query index.
+    With the FLANN backend, the stacked descriptors_a are queried against the (cached) KD-tree index of descriptor_b,
+    in the same direction as with brute force, so that the ratio test and the numbers of matches are comparable
+    between the backends.
+    """
     # make sure that number of features in both test and query image is greater than or equal to number of nearest neighbors in knn match.
-    if len(descriptor_a) < MIN_NUMBER_OF_MATCHES or len(descriptor_b) < MIN_NUMBER_OF_MATCHES:
-        return 100
+    if not descriptors_a or len(descriptor_b) < MIN_NUMBER_OF_MATCHES:
+        return [100] * len(descriptors_a)
 
-    matches = _get_matches(descriptor_a, descriptor_b)
-    avg_number_of_descriptors = (len(descriptor_a) + len(descriptor_b)) / 2
-    percent_of_matches = len(matches) / avg_number_of_descriptors
-    if percent_of_matches < 0.1:
-        return 100  # Less than 10% matches -> No Similarity
+    stacked_descriptors_a, offsets = stack_descriptors(descriptors_a)
+    if backend == MatcherBackend.FLANN:
+        matches = [m for m in map(_ratio_test, knn_match(FLANN_INDEXES, stacked_descriptors_a, descriptor_b, MIN_NUMBER_OF_MATCHES)) if m is not None]
+    else:
+        matches = _get_matches(stacked_descriptors_a, descriptor_b)
+    query_indices = np.fromiter((m.queryIdx for m in matches), dtype=np.intp, count=len(matches))
+    distances = np.fromiter((m.distance for m in matches), dtype=np.float64, count=len(matches))
+    numbers_of_matches, total_distances = sum_per_segment(query_indices, distances, offsets)
+    numbers_of_descriptors_a = np.diff(offsets)
 
-    # sum distances
-    total_distance = sum([m.distance for m in matches])
-    # divide by number of matches
-    avg_distance = (total_distance / len(matches)) / 512 if len(matches) > 0 else 100
-    return avg_distance
+    avg_distances = []
+    for number_of_matches, total_distance, number_of_descriptors_a in zip(numbers_of_matches, total_distances, numbers_of_descriptors_a):
+        avg_number_of_descriptors = (number_of_descriptors_a + len(descriptor_b)) / 2
+        percent_of_matches = number_of_matches / avg_number_of_descriptors
+        if number_of_descriptors_a < MIN_NUMBER_OF_MATCHES or percent_of_matches < 0.1:
+            avg_distances.append(100)  # Less than 10% matches -> No Similarity
+        else:
+            avg_distances.append((total_distance / number_of_matches) / 512)
+    return avg_distances
 
 
 @timing
-def get_keypoints_and_descriptors_for_object(grayscale_image, mask):
+def get_keypoints_and_descriptors_for_object(grayscale_image, mask, max_features=None, scale=1.0):
     """
-    Detect SIFT features and compute descriptors.
+    Detect SIFT features and compute descriptors within the bounding box of the object.
     :param grayscale_image: whole image as grayscale
-    :param mask: search mask that restricts the area in which to search for keypoints
+    :param mask: CompactMask of the object that restricts the area in which to search for keypoints
+    :param max_features: number of keypoints to keep (all if None)
+    :param scale: level of the image pyramid the features are extracted on (e.g. 0.5 for half the size)
     :return:
     """
-    return SIFT.detectAndCompute(grayscale_image, mask)
+    return detect_and_compute_in_bbox(SIFT, grayscale_image, mask, CROP_MARGIN, max_features, scale)
 
 
 def _get_matches(descriptor_a, descriptor_b):
@@ -67,3 +103,26 @@ def _get_matches(descriptor_a, descriptor_b):
         if m.distance < ratio_thresh * n.distance:
             good_matches.append(m)
     return good_matches
+
+
+def _ratio_test(knn_matches, ratio_thresh=0.7):
+    """
+    Lowe's ratio test for the approximate nearest neighbors of a descriptor, which may be less than two
+    :returns the nearest neighbor if it passes the test or None
+    """
+    if len(knn_matches) < MIN_NUMBER_OF_MATCHES:
+        return None
+    m, n = knn_matches[:2]
+    return m if m.distance < ratio_thresh * n.distance else None
+
+
+@timing
+def get_keypoints_and_descriptors_for_objects(grayscale_image, masks, max_features_per_mask=None):
+    """
+    Detect SIFT features and compute descriptors once for all objects of the frame.
+    :param grayscale_image: whole image as grayscale
+    :param masks: CompactMasks of all objects of the frame
+    :param max_features_per_mask: number of keypoints to keep for all or for every mask (all if None)
+    :return: list with a tuple of keypoints and descriptors for every mask
+    """
+    return detect_and_compute_in_masks(SIFT, grayscale_image, masks, CROP_MARGIN, max_features_per_mask)
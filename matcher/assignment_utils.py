@@ -0,0 +1,33 @@
+"""Functions to associate detections of a frame with existing object tracks"""
+from typing import Dict
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+# Cost of pairs that are never assigned
+FORBIDDEN_COST = np.inf
+
+
+def assign_by_similarity(similarities: np.ndarray, min_similarity: float) -> Dict[int, int]:
+    """
+    Solves the assignment of detections to tracks globally with the Hungarian algorithm. Every detection may also be
+    left unassigned at the cost of a pair with min_similarity, so a pair is worth its similarity above min_similarity
+    and the summed similarity above min_similarity of all assigned pairs is maximized. Thus a single very similar pair
+    wins over several barely similar ones, instead of assigning as many pairs as possible. Pairs with a similarity of
+    at most min_similarity are never assigned.
+    :param similarities: matrix of shape (number of detections, number of tracks) with values in the range of [0, 1]
+    :param min_similarity: similarity a pair has to exceed to be assigned
+    :return: dict mapping the row index of every assigned detection to the column index of its track
+    """
+    if similarities.size == 0:
+        return {}
+    number_of_detections, number_of_tracks = similarities.shape
+    allowed = similarities > min_similarity
+    # One column per detection to leave it unassigned
+    unassigned_costs = np.full((number_of_detections, number_of_detections), FORBIDDEN_COST)
+    np.fill_diagonal(unassigned_costs, 1 - min_similarity)
+    costs = np.hstack([np.where(allowed, 1 - similarities, FORBIDDEN_COST), unassigned_costs])
+    detection_indices, track_indices = linear_sum_assignment(costs)
+    return {int(detection_index): int(track_index)
+            for detection_index, track_index in zip(detection_indices, track_indices)
+            if track_index < number_of_tracks}
@@ -0,0 +1,24 @@
+"""Functions to match the descriptors of several objects against the descriptors of one object in a single call"""
+import numpy as np
+
+
+def stack_descriptors(descriptor_list: [np.ndarray]):
+    """
+    :returns all descriptors stacked into one matrix and the offset table: the descriptors of object i are the rows
+    offsets[i]:offsets[i + 1]
+    """
+    offsets = np.zeros(len(descriptor_list) + 1, dtype=np.intp)
+    offsets[1:] = np.cumsum([len(descriptors) for descriptors in descriptor_list])
+    return np.concatenate(descriptor_list), offsets
+
+
+def sum_per_segment(query_indices: np.ndarray, values: np.ndarray, offsets: np.ndarray):
+    """
+    Splits values belonging to rows of stacked descriptors back by object
+    :returns number of values and sum of the values per object of the offset table
+    """
+    number_of_segments = len(offsets) - 1
+    segments = np.searchsorted(offsets, query_indices, side="right") - 1
+    counts = np.bincount(segments, minlength=number_of_segments)
+    sums = np.bincount(segments, weights=values, minlength=number_of_segments)
+    return counts, sums
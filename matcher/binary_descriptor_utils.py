@@ -0,0 +1,59 @@
+"""Functions to match binary descriptors (ORB, AKAZE, BRISK) by their Hamming distance, shared by their matchers"""
+import cv2
+import numpy as np
+
+from Constants import MatcherBackend
+from matcher.batch_utils import stack_descriptors, sum_per_segment
+from matcher.flann_utils import FlannIndexCache, knn_match, mutual_matches, nearest
+
+SIMPLE_DESCRIPTOR_MATCHER = cv2.DescriptorMatcher_create(cv2.DESCRIPTOR_MATCHER_BRUTEFORCE_HAMMING)
+
+# Makes sure matches match both ways: min(desc_a, desc_b)
+CROSS_CHECK_DESCRIPTOR_MATCHER = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+
+
+def get_binary_matches(descriptor_a, descriptor_b, max_distance: float, flann_indexes: FlannIndexCache, backend: MatcherBackend):
+    """
+    Calculates matches between descriptors a and b that match both ways.
+    Only return matches with a maximum distance of max_distance.
+    """
+    if backend == MatcherBackend.FLANN:
+        matches = mutual_matches(flann_indexes, descriptor_a, descriptor_b)
+    else:
+        matches = CROSS_CHECK_DESCRIPTOR_MATCHER.match(descriptor_a, descriptor_b, None)
+    filtered_matches = list(filter(lambda m: m.distance <= max_distance, matches))
+    return filtered_matches
+
+
+def average_binary_descriptor_distances(descriptors_a: list, descriptor_b, distance_normalization: float, flann_indexes: FlannIndexCache,
+                                        backend: MatcherBackend) -> [float]:
+    """
+    Calculates the average distance between matched keypoints for every descriptor_a in descriptors_a with a single
+    match call: descriptors_a are stacked and matched against descriptor_b at once, the matches are split back by
+    their query index.
+    With the FLANN backend, the stacked descriptors_a are queried against the (cached) LSH index of descriptor_b, in
+    the same direction as with brute force, so that the numbers of matches are comparable between the backends.
+    The distances are divided by distance_normalization, 100 is returned in case less than 10% of the keypoints match
+    to signal "no match".
+    """
+    if not descriptors_a:
+        return []
+    stacked_descriptors_a, offsets = stack_descriptors(descriptors_a)
+    if backend == MatcherBackend.FLANN:
+        matches = [m for m in map(nearest, knn_match(flann_indexes, stacked_descriptors_a, descriptor_b, 1)) if m is not None]
+    else:
+        matches = SIMPLE_DESCRIPTOR_MATCHER.match(stacked_descriptors_a, descriptor_b, None)
+    query_indices = np.fromiter((m.queryIdx for m in matches), dtype=np.intp, count=len(matches))
+    distances = np.fromiter((m.distance for m in matches), dtype=np.float64, count=len(matches))
+    numbers_of_matches, total_distances = sum_per_segment(query_indices, distances, offsets)
+    numbers_of_descriptors_a = np.diff(offsets)
+
+    avg_distances = []
+    for number_of_matches, total_distance, number_of_descriptors_a in zip(numbers_of_matches, total_distances, numbers_of_descriptors_a):
+        avg_number_of_descriptors = (number_of_descriptors_a + len(descriptor_b)) / 2
+        percent_of_matches = number_of_matches / avg_number_of_descriptors
+        if percent_of_matches < 0.1:
+            avg_distances.append(100)  # Less than 10% matches -> No Similarity
+        else:
+            avg_distances.append(total_distance / number_of_matches / distance_normalization)
+    return avg_distances
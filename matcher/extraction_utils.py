@@ -0,0 +1,204 @@
+"""Functions shared by the matchers to extract features of objects"""
+from math import ceil, log2
+from typing import List, Optional, Union
+
+import cv2
+import numpy as np
+
+from data_model.CompactMask import CompactMask
+from matcher.keypoint_utils import empty_keypoints, from_cv_keypoints
+
+# Pixels around the bounding box that are kept when cropping, so that keypoints close to the object border still have
+# enough surrounding image for their descriptors (ORB's default edge threshold is 31px)
+CROP_MARGIN = 32
+
+# Adaptive feature budget (see get_feature_budgets): number of keypoints per object grows with the area of its mask
+FEATURES_PER_PIXEL = 0.01
+MIN_FEATURES_PER_OBJECT = 20
+MAX_FEATURES_PER_OBJECT = 1000
+# Objects larger than this (in pixel) are extracted on a coarser level of an image pyramid (see get_extraction_scale)
+MAX_OBJECT_SIZE_FOR_EXTRACTION = 256
+
+
+def get_feature_budgets(masks: [CompactMask], max_features_per_frame: int) -> List[int]:
+    """
+    Distributes the keypoints of a frame among its objects: every object gets a number of keypoints proportional to
+    the area of its mask (within MIN_ and MAX_FEATURES_PER_OBJECT). If that exceeds max_features_per_frame in total,
+    all budgets are scaled down, so that the extraction time per frame is bounded whatever the scene looks like.
+    :returns maximum number of keypoints for every mask
+    """
+    if not masks:
+        return []
+    areas = np.array([mask.get_area() for mask in masks], dtype=np.float64)
+    budgets = np.clip(np.round(areas * FEATURES_PER_PIXEL), MIN_FEATURES_PER_OBJECT, MAX_FEATURES_PER_OBJECT)
+    total = budgets.sum()
+    if total > max_features_per_frame:
+        budgets = np.floor(budgets * max_features_per_frame / total)
+    return budgets.astype(int).tolist()
+
+
+def get_extraction_scale(mask: CompactMask) -> float:
+    """
+    :returns scale of the pyramid level (1, 0.5, 0.25, ...) on which the object is at most
+    MAX_OBJECT_SIZE_FOR_EXTRACTION pixels wide and high
+    """
+    size = max(mask.cropped_mask.shape)
+    if size <= MAX_OBJECT_SIZE_FOR_EXTRACTION:
+        return 1.0
+    return 0.5 ** ceil(log2(size / MAX_OBJECT_SIZE_FOR_EXTRACTION))
+
+
+def detect_and_compute(feature_detector, image, search_mask, max_features: Optional[int] = None):
+    """
+    Detects keypoints and computes their descriptors, only for the max_features keypoints with the strongest response
+    (None keeps all), so that no descriptors are computed for keypoints that are dropped anyway.
+    :return: tuple of cv2.KeyPoints and descriptors (None if there are no keypoints)
+    """
+    if max_features is None:
+        return feature_detector.detectAndCompute(image, search_mask)
+    cv_keypoints = _retain_best(feature_detector.detect(image, search_mask), max_features)
+    if not cv_keypoints:
+        return [], None
+    return feature_detector.compute(image, cv_keypoints)
+
+
+def _retain_best(cv_keypoints, max_features: int):
+    """
+    :returns the max_features keypoints with the strongest response in their original order
+    """
+    if len(cv_keypoints) <= max_features:
+        return list(cv_keypoints)
+    responses = np.fromiter((keypoint.response for keypoint in cv_keypoints), dtype=np.float32, count=len(cv_keypoints))
+    strongest = np.sort(np.argsort(-responses, kind="stable")[:max_features])
+    return [cv_keypoints[i] for i in strongest]
+
+
+def detect_and_compute_in_bbox(feature_detector, grayscale_image, mask: CompactMask, margin=CROP_MARGIN, max_features: Optional[int] = None,
+                               scale=1.0):
+    """
+    Detects keypoints and computes their descriptors within the bounding box of the object plus a margin instead of
+    the whole image, so that the cost scales with the size of the object.
+    :param feature_detector: OpenCV Feature2D such as SIFT, SURF or ORB
+    :param grayscale_image: whole image as grayscale
+    :param mask: CompactMask of the object that restricts the area in which to search for keypoints
+    :param margin: pixels around the bounding box that are cropped as well (on the level of the given scale)
+    :param max_features: keep only this many keypoints with the strongest response (None keeps all)
+    :param scale: level of the image pyramid the features are extracted on (e.g. 0.5 for half the size)
+    :return: keypoint array (see keypoint_utils) in coordinates of the whole image and their descriptors
+    """
+    margin = ceil(margin / scale)
+    height, width = grayscale_image.shape[:2]
+    y1, x1 = max(mask.y1 - margin, 0), max(mask.x1 - margin, 0)
+    y2, x2 = min(mask.get_y2() + margin, height), min(mask.get_x2() + margin, width)
+    if y2 <= y1 or x2 <= x1:
+        return empty_keypoints(), None
+
+    cropped_image = grayscale_image[y1:y2, x1:x2]
+    cropped_search_mask = mask.moved_by(-x1, -y1).to_full_mask(cropped_image.shape)
+    if scale != 1.0:
+        cropped_image = cv2.resize(cropped_image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        cropped_search_mask = cv2.resize(cropped_search_mask, cropped_image.shape[::-1], interpolation=cv2.INTER_NEAREST)
+    cv_keypoints, descriptors = detect_and_compute(feature_detector, cropped_image, cropped_search_mask, max_features)
+
+    keypoints = from_cv_keypoints(cv_keypoints)
+    if scale != 1.0:
+        keypoints["pt"] = (keypoints["pt"] + 0.5) / scale - 0.5  # Pixel centers of the pyramid level to the crop
+        keypoints["size"] /= scale
+    keypoints["pt"] += (x1, y1)  # Move keypoints back into the coordinates of the whole image
+    return keypoints, descriptors
+
+
+def detect_and_compute_in_masks(feature_detector, grayscale_image, masks: [CompactMask], margin=CROP_MARGIN,
+                                max_features_per_mask: Union[None, int, List[int]] = None):
+    """
+    Detects keypoints and computes their descriptors once for all objects of a frame within the union of their masks
+    and assigns every keypoint to all objects whose mask contains it. Avoids building the image pyramid or scale space
+    once per object, which is redundant when many (overlapping) objects are in view.
+    If the number of keypoints is limited, descriptors are only computed for the keypoints that are kept.
+    :param feature_detector: OpenCV Feature2D such as SIFT, SURF or ORB
+    :param grayscale_image: whole image as grayscale
+    :param masks: CompactMasks of all objects of the frame
+    :param margin: pixels around the union of the bounding boxes that are cropped as well
+    :param max_features_per_mask: keep only this many keypoints with the strongest response per mask, either one
+    number for all masks or a list with a number for every mask (None keeps all)
+    :return: list with a tuple of a keypoint array (in coordinates of the whole image) and descriptors for every mask
+    """
+    if not masks:
+        return []
+    height, width = grayscale_image.shape[:2]
+    y1 = max(min(mask.y1 for mask in masks) - margin, 0)
+    x1 = max(min(mask.x1 for mask in masks) - margin, 0)
+    y2 = min(max(mask.get_y2() for mask in masks) + margin, height)
+    x2 = min(max(mask.get_x2() for mask in masks) + margin, width)
+    if y2 <= y1 or x2 <= x1:
+        return [(empty_keypoints(), None) for _ in masks]
+
+    cropped_image = grayscale_image[y1:y2, x1:x2]
+    union_search_mask = np.zeros(cropped_image.shape, dtype=np.uint8)
+    for mask in masks:
+        frame_slices, mask_part = mask.moved_by(-x1, -y1).clip_to_frame(cropped_image.shape)
+        union_search_mask[frame_slices] |= mask_part
+    if max_features_per_mask is None:
+        cv_keypoints, descriptors = feature_detector.detectAndCompute(cropped_image, union_search_mask)
+    else:
+        cv_keypoints, descriptors = feature_detector.detect(cropped_image, union_search_mask), None
+    if not cv_keypoints:
+        return [(empty_keypoints(), None) for _ in masks]
+
+    keypoints = from_cv_keypoints(cv_keypoints)
+    keypoints["pt"] += (x1, y1)  # Move keypoints back into the coordinates of the whole image
+    if isinstance(max_features_per_mask, list):
+        budgets = max_features_per_mask
+    else:
+        budgets = [max_features_per_mask] * len(masks)
+    pixels_x = np.clip(np.round(keypoints["pt"][:, 0]).astype(int), 0, width - 1)
+    pixels_y = np.clip(np.round(keypoints["pt"][:, 1]).astype(int), 0, height - 1)
+    indices_per_mask = [_get_indices_in_mask(pixels_x, pixels_y, keypoints["response"], mask, budget) for mask, budget in zip(masks, budgets)]
+
+    if descriptors is None:
+        # Compute descriptors only for the keypoints kept for any mask
+        kept_indices = np.unique(np.concatenate(indices_per_mask))
+        kept_cv_keypoints = [cv_keypoints[i] for i in kept_indices]
+        computed_cv_keypoints, descriptors = feature_detector.compute(cropped_image, kept_cv_keypoints) if kept_cv_keypoints else ([], None)
+        rows = np.full(len(keypoints), -1)  # row of every detected keypoint in the computed ones or -1
+        rows[kept_indices[_get_remaining_indices(kept_cv_keypoints, computed_cv_keypoints)]] = np.arange(len(computed_cv_keypoints))
+        keypoints = from_cv_keypoints(computed_cv_keypoints)
+        keypoints["pt"] += (x1, y1)
+        indices_per_mask = [rows[indices][rows[indices] >= 0] for indices in indices_per_mask]
+
+    features_per_mask = []
+    for indices in indices_per_mask:
+        if len(indices) == 0:
+            features_per_mask.append((empty_keypoints(), None))
+        else:
+            features_per_mask.append((keypoints[indices], descriptors[indices]))
+    return features_per_mask
+
+
+def _get_remaining_indices(cv_keypoints, remaining_cv_keypoints) -> np.ndarray:
+    """
+    Detectors drop keypoints for which they can't compute a descriptor (e.g. close to the image border), but keep the
+    order of the remaining ones.
+    :returns index of every remaining keypoint in cv_keypoints
+    """
+    indices = np.empty(len(remaining_cv_keypoints), dtype=np.intp)
+    index = 0
+    for i, remaining_cv_keypoint in enumerate(remaining_cv_keypoints):
+        while cv_keypoints[index].pt != remaining_cv_keypoint.pt:
+            index += 1
+        indices[i] = index
+        index += 1
+    return indices
+
+
+def _get_indices_in_mask(pixels_x: np.ndarray, pixels_y: np.ndarray, responses: np.ndarray, mask: CompactMask, max_features: Optional[int]) -> np.ndarray:
+    """
+    :returns indices of the keypoints whose pixel lies within the mask, only the max_features ones with the strongest
+    response (None keeps all)
+    """
+    indices = np.flatnonzero((pixels_y >= mask.y1) & (pixels_y < mask.get_y2()) & (pixels_x >= mask.x1) & (pixels_x < mask.get_x2()))
+    indices = indices[mask.cropped_mask[pixels_y[indices] - mask.y1, pixels_x[indices] - mask.x1]]
+    if max_features is not None and len(indices) > max_features:
+        strongest = np.argsort(-responses[indices], kind="stable")[:max_features]
+        indices = np.sort(indices[strongest])
+    return indices
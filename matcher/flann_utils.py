@@ -0,0 +1,94 @@
+"""
+Functions and indexes for approximate nearest neighbor matching with FLANN.
+
+The index is built on the descriptors of the new object of a frame, which the stacked references of all of its
+candidate object tracks are queried against, in the same direction as with brute force. Indexing the references of
+the object tracks instead wouldn't save any index: the reference of a track is the object instance it was last
+assigned, i.e. a new object of a previous frame, so every object gets indexed exactly once either way. The index of
+the new object is reused by get_matches in the same frame and against the new object of the next frame, but a new
+index is built in every frame.
+"""
+from collections import OrderedDict
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+FLANN_INDEX_KDTREE = 1
+FLANN_INDEX_LSH = 6
+
+# Randomized KD-trees for float descriptors (SIFT, SURF)
+KDTREE_INDEX_PARAMS = dict(algorithm=FLANN_INDEX_KDTREE, trees=5)
+# Locality sensitive hashing for binary descriptors (ORB, AKAZE, BRISK)
+LSH_INDEX_PARAMS = dict(algorithm=FLANN_INDEX_LSH, table_number=6, key_size=12, multi_probe_level=1)
+SEARCH_PARAMS = dict(checks=50)
+
+
+class FlannIndexCache:
+    """
+    LRU cache of FLANN indexes, keyed by the identity of the indexed descriptors. This way the descriptors of a new
+    object are indexed once, see the module docstring.
+    Entries hold a reference to their descriptors, so that their ids can't be reused while cached.
+    """
+
+    def __init__(self, index_params: dict, max_size: int = 256):
+        self.index_params = index_params
+        self.max_size = max(1, max_size)
+        self.entries: OrderedDict = OrderedDict()  # id of descriptors -> (descriptors, trained matcher)
+
+    def get(self, descriptors: np.ndarray) -> cv2.FlannBasedMatcher:
+        """
+        :returns a matcher whose trained index holds the descriptors, queries are matched against them
+        """
+        key = id(descriptors)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key][1]
+        matcher = cv2.FlannBasedMatcher(self.index_params, SEARCH_PARAMS)
+        matcher.add([descriptors])
+        matcher.train()
+        self.entries[key] = (descriptors, matcher)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return matcher
+
+    def clear(self):
+        self.entries.clear()
+
+
+def knn_match(index_cache: FlannIndexCache, query_descriptors, train_descriptors, k: int):
+    """
+    Finds the k approximate nearest neighbors of every query descriptor in the (indexed) train descriptors.
+    :returns list of matches per query descriptor like DescriptorMatcher.knnMatch, which may hold less than k
+    matches (e.g. if LSH finds no candidates)
+    """
+    if len(query_descriptors) == 0:
+        return []
+    if train_descriptors is None or len(train_descriptors) == 0:
+        return [[] for _ in range(len(query_descriptors))]
+    return index_cache.get(train_descriptors).knnMatch(query_descriptors, k=k)
+
+
+def nearest(knn_matches: list) -> Optional[cv2.DMatch]:
+    """
+    :returns the nearest neighbor or None if there is none
+    """
+    return knn_matches[0] if knn_matches else None
+
+
+def mutual_matches(index_cache: FlannIndexCache, descriptor_a, descriptor_b) -> List[cv2.DMatch]:
+    """
+    Approximate counterpart of a cross checked brute force matcher: keeps the nearest neighbor of a descriptor of a in
+    b only if that is the other way around as well.
+    """
+    forward_matches = knn_match(index_cache, descriptor_a, descriptor_b, 1)
+    backward_matches = knn_match(index_cache, descriptor_b, descriptor_a, 1)
+    matches = []
+    for knn_matches in forward_matches:
+        m = nearest(knn_matches)
+        if m is None:
+            continue
+        backward = nearest(backward_matches[m.trainIdx])
+        if backward is not None and backward.trainIdx == m.queryIdx:
+            matches.append(m)
+    return matches
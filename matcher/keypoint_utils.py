@@ -0,0 +1,34 @@
+"""Functions to store keypoints compactly in structured NumPy arrays instead of lists of cv2.KeyPoint"""
+import cv2
+import numpy as np
+
+# Position (x, y), diameter, orientation, strength and pyramid octave of a keypoint, as in cv2.KeyPoint
+KEYPOINT_DTYPE = np.dtype([
+    ("pt", np.float32, (2,)),
+    ("size", np.float32),
+    ("angle", np.float32),
+    ("response", np.float32),
+    ("octave", np.int32),
+])
+
+
+def empty_keypoints() -> np.ndarray:
+    """
+    :returns keypoint array without any keypoints
+    """
+    return np.empty(0, dtype=KEYPOINT_DTYPE)
+
+
+def from_cv_keypoints(keypoints) -> np.ndarray:
+    """
+    :returns structured array of KEYPOINT_DTYPE holding the given cv2.KeyPoints
+    """
+    return np.array([(keypoint.pt, keypoint.size, keypoint.angle, keypoint.response, keypoint.octave) for keypoint in keypoints], dtype=KEYPOINT_DTYPE)
+
+
+def to_cv_keypoints(keypoints: np.ndarray) -> [cv2.KeyPoint]:
+    """
+    Converts a keypoint array back to cv2.KeyPoints, only needed to draw them with OpenCV (e.g. cv2.drawMatches)
+    """
+    return [cv2.KeyPoint(float(x), float(y), float(size), float(angle), float(response), int(octave))
+            for (x, y), size, angle, response, octave in keypoints.tolist()]
@@ -0,0 +1,39 @@
+"""Functions to propagate keypoints from one frame into the next with pyramidal Lucas-Kanade optical flow"""
+from typing import Tuple
+
+import cv2
+import numpy as np
+
+from data_model.CompactMask import CompactMask
+
+# Search window and pyramid levels of Lucas-Kanade, 3 levels follow motions of about 8 times the window size
+LK_PARAMS = dict(winSize=(21, 21), maxLevel=3, criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 30, 0.01))
+# Largest distance in pixel between a point and its position after tracking it forward and backward again
+MAX_FORWARD_BACKWARD_ERROR = 1.0
+
+
+def track_points(previous_grayscale_image, grayscale_image, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Tracks the points from the previous into the current image and back again. Points that are lost in either
+    direction or don't return to their origin are considered unreliable (e.g. occluded or on the object boundary).
+    :param points: (N, 2) positions (x, y) in the previous image
+    :returns tuple of the (N, 2) float32 positions in the current image and a boolean array of the reliable points
+    """
+    if len(points) == 0:
+        return np.empty((0, 2), dtype=np.float32), np.zeros(0, dtype=bool)
+    points = np.ascontiguousarray(points, dtype=np.float32).reshape(-1, 1, 2)
+    tracked_points, status, _ = cv2.calcOpticalFlowPyrLK(previous_grayscale_image, grayscale_image, points, None, **LK_PARAMS)
+    returned_points, returned_status, _ = cv2.calcOpticalFlowPyrLK(grayscale_image, previous_grayscale_image, tracked_points, None, **LK_PARAMS)
+    forward_backward_errors = np.linalg.norm((points - returned_points).reshape(-1, 2), axis=1)
+    reliable = (status.ravel() == 1) & (returned_status.ravel() == 1) & (forward_backward_errors < MAX_FORWARD_BACKWARD_ERROR)
+    return tracked_points.reshape(-1, 2), reliable
+
+
+def get_indices_of_points_in_mask(points: np.ndarray, mask: CompactMask) -> np.ndarray:
+    """
+    :returns indices of the (N, 2) positions (x, y) whose pixel lies within the mask
+    """
+    pixels = np.floor(points).astype(np.intp).reshape(-1, 2)
+    pixels_x, pixels_y = pixels[:, 0], pixels[:, 1]
+    indices = np.flatnonzero((pixels_y >= mask.y1) & (pixels_y < mask.get_y2()) & (pixels_x >= mask.x1) & (pixels_x < mask.get_x2()))
+    return indices[mask.cropped_mask[pixels_y[indices] - mask.y1, pixels_x[indices] - mask.x1]]
@@ -3,20 +3,13 @@ Configuration specific to MS COCO
 """
 import os
 
-import mrcnn.model as modellib
-
-# Import Mask RCNN
-from Constants import ROOT_DIR, INPUT_DIMENSIONS
-from mrcnn import utils
-
-# Local path to trained weights file
+import Constants
+from Constants import ROOT_DIR
 from mrcnn.config import Config
 from utils.timer import timing
 
+# Local path to trained weights file
 COCO_MODEL_PATH = os.path.join(ROOT_DIR, "weights/mask_rcnn_coco.h5")
-# Download COCO trained weights from Releases if needed
-if not os.path.exists(COCO_MODEL_PATH):
-    utils.download_trained_weights(COCO_MODEL_PATH)
 
 
 # ## Configurations
@@ -61,25 +54,101 @@ def find_closest_acceptable_number(number):
 
 
 class InferenceConfig(CocoConfig):
-    # Set batch size to 1 since we'll be running inference on
+    # Set batch size to 1 by default since we'll be running inference on
     # one image at a time. Batch size = GPU_COUNT * IMAGES_PER_GPU
     GPU_COUNT = 1
     IMAGES_PER_GPU = 1
-    IMAGE_MIN_DIM = find_closest_acceptable_number(min(INPUT_DIMENSIONS))
-    IMAGE_MAX_DIM = find_closest_acceptable_number(max(INPUT_DIMENSIONS))  # TODO: experiment with results and timing to see if its worth to lower this
 
     DETECTION_MIN_CONFIDENCE = 0.8
 
+    # Keep masks cropped to their bounding boxes, full frame masks are only created on demand
+    COMPACT_MASKS = True
 
-config = InferenceConfig()
-config.display()
+    def __init__(self, images_per_gpu=None):
+        """
+        images_per_gpu: overrides the number of images that are run through the model at once
+        The image dimensions and the resize backend are taken from Constants once the configuration is created.
+        """
+        if images_per_gpu is not None:
+            self.IMAGES_PER_GPU = images_per_gpu
+        self.IMAGE_MIN_DIM = find_closest_acceptable_number(min(Constants.INPUT_DIMENSIONS))
+        self.IMAGE_MAX_DIM = find_closest_acceptable_number(max(Constants.INPUT_DIMENSIONS))  # TODO: experiment with results and timing to see if its worth to lower this
+        self.RESIZE_BACKEND = Constants.RESIZE_BACKEND.value.lower()
+        super().__init__()
 
-## Create Model and Load Trained Weights
-# Create model object in inference mode.
-model = modellib.MaskRCNN(mode="inference", model_dir="logs", config=config)
 
-# Load weights trained on MS-COCO
-model.load_weights(COCO_MODEL_PATH, by_name=True)
+class Detector:
+    """
+    Mask R-CNN with weights trained on MS-COCO.
+    Building the model and loading its weights takes a long time, so both only happen on the first detection.
+    The model is built for a fixed batch_size, the number of images that are run through it at once.
+    """
+
+    def __init__(self, batch_size=1, weights_path=COCO_MODEL_PATH):
+        self.config = InferenceConfig(images_per_gpu=batch_size)
+        self.weights_path = weights_path
+        self._model = None
+
+    def get_model(self):
+        """
+        :returns the Mask R-CNN model, which gets built on first use
+        """
+        if self._model is None:
+            self._model = self._build_model()
+        return self._model
+
+    @timing
+    def _build_model(self):
+        # Importing the model pulls in TensorFlow and Keras, so it is deferred until the model is needed
+        import mrcnn.model as modellib
+        from mrcnn import utils
+
+        # Download COCO trained weights from Releases if needed
+        if not os.path.exists(self.weights_path):
+            utils.download_trained_weights(self.weights_path)
+
+        self.config.display()
+
+        ## Create Model and Load Trained Weights
+        # Create model object in inference mode.
+        model = modellib.MaskRCNN(mode="inference", model_dir="logs", config=self.config)
+
+        # Load weights trained on MS-COCO
+        model.load_weights(self.weights_path, by_name=True)
+        return model
+
+    def detect(self, image):
+        """
+        Runs the detection on a given image
+        """
+        return self.detect_batch([image])[0]
+
+    def detect_batch(self, images) -> [dict]:
+        """
+        Runs the detection on a list of images with one prediction of the model per batch_size images
+        :returns a result per image in the order of the images
+        """
+        batch_size = self.config.BATCH_SIZE
+        results = []
+        for start in range(0, len(images), batch_size):
+            batch = list(images[start:start + batch_size])
+            # The model only takes full batches, so the last one is filled up with copies of its last image
+            padding = [batch[-1]] * (batch_size - len(batch))
+            results.extend(self.get_model().detect(batch + padding, verbose=0)[:len(batch)])
+        return results
+
+
+_detector = None
+
+
+def get_detector() -> Detector:
+    """
+    :returns the detector shared within the process
+    """
+    global _detector
+    if _detector is None:
+        _detector = Detector(batch_size=Constants.DETECTION_BATCH_SIZE)
+    return _detector
 
 
 @timing
@@ -87,8 +156,13 @@ def detect(image):
     """
     Runs the detection on a given image
     """
-    # Run detection
-    results = model.detect([image], verbose=0)
+    return get_detector().detect(image)
+
 
-    # ignore batch dimension
-    return results[0]
+@timing
+def detect_batch(images) -> [dict]:
+    """
+    Runs the detection on a list of images in batches
+    :returns a result per image in the order of the images
+    """
+    return get_detector().detect_batch(images)
@@ -161,6 +161,16 @@ class Config(object):
     # To change this you also need to change the neural network mask branch
     MASK_SHAPE = [28, 28]
 
+    # Library used to resize input images and instance masks: "skimage" or
+    # "opencv". The opencv backend is faster, its masks stay within
+    # utils.OPENCV_RESIZE_MIN_MASK_IOU of the skimage ones.
+    RESIZE_BACKEND = "skimage"
+
+    # If enabled, detection results hold each instance mask as a CompactMask
+    # cropped to its bounding box instead of a full [height, width] mask.
+    # Saves a lot of memory for high-resolution images.
+    COMPACT_MASKS = False
+
     # Maximum number of ground truth instances to use in one image
     MAX_GT_INSTANCES = 100
 
@@ -21,6 +21,7 @@ import keras.layers as KL
 import keras.engine as KE
 import keras.models as KM
 
+from data_model.CompactMask import CompactMask
 from mrcnn import utils
 
 # Requires TensorFlow 1.3+ and Keras 2.0.8+.
@@ -1387,7 +1388,12 @@ class MaskRCNN:
             # Resize image
             # TODO: move resizing to mold_image()
             molded_image, window, scale, padding, crop = utils.resize_image(
-                image, min_dim=self.config.IMAGE_MIN_DIM, min_scale=self.config.IMAGE_MIN_SCALE, max_dim=self.config.IMAGE_MAX_DIM, mode=self.config.IMAGE_RESIZE_MODE
+                image,
+                min_dim=self.config.IMAGE_MIN_DIM,
+                min_scale=self.config.IMAGE_MIN_SCALE,
+                max_dim=self.config.IMAGE_MAX_DIM,
+                mode=self.config.IMAGE_RESIZE_MODE,
+                backend=self.config.RESIZE_BACKEND,
             )
             molded_image = mold_image(molded_image, self.config)
             # Build image_meta
@@ -1418,7 +1424,8 @@ class MaskRCNN:
         boxes: [N, (y1, x1, y2, x2)] Bounding boxes in pixels
         class_ids: [N] Integer class IDs for each bounding box
         scores: [N] Float probability scores of the class_id
-        masks: [height, width, num_instances] Instance masks
+        masks: [height, width, num_instances] Instance masks or a list of
+            num_instances CompactMasks if config.COMPACT_MASKS is enabled
         """
         # How many detections do we have?
         # Detections array is padded with zeros. Find the first class_id == 0.
@@ -1454,11 +1461,20 @@ class MaskRCNN:
             masks = np.delete(masks, exclude_ix, axis=0)
             N = class_ids.shape[0]
 
+        if self.config.COMPACT_MASKS:
+            # Resize masks to the size of their bounding box and set boundary threshold.
+            compact_masks = []
+            for i in range(N):
+                y1, x1 = boxes[i][:2]
+                cropped_mask = utils.unmold_mask_cropped(masks[i], boxes[i], self.config.RESIZE_BACKEND)
+                compact_masks.append(CompactMask(int(y1), int(x1), cropped_mask, tuple(original_image_shape[:2])))
+            return boxes, class_ids, scores, compact_masks
+
         # Resize masks to original image size and set boundary threshold.
         full_masks = []
         for i in range(N):
             # Convert neural network mask to full size mask
-            full_mask = utils.unmold_mask(masks[i], boxes[i], original_image_shape)
+            full_mask = utils.unmold_mask(masks[i], boxes[i], original_image_shape, self.config.RESIZE_BACKEND)
             full_masks.append(full_mask)
         full_masks = np.stack(full_masks, axis=-1) if full_masks else np.empty(original_image_shape[:2] + (0,))
 
@@ -1473,7 +1489,8 @@ class MaskRCNN:
         rois: [N, (y1, x1, y2, x2)] detection bounding boxes
         class_ids: [N] int class IDs
         scores: [N] float probability scores for the class IDs
-        masks: [H, W, N] instance binary masks
+        masks: [H, W, N] instance binary masks or a list of N CompactMasks
+            if config.COMPACT_MASKS is enabled
         """
         assert self.mode == "inference", "Create model in inference mode."
         assert len(images) == self.config.BATCH_SIZE, "len(images) must be equal to BATCH_SIZE"
@@ -10,6 +10,7 @@ Adapted by Johannes Berger
 """
 
 import random
+import cv2
 import numpy as np
 import tensorflow as tf
 import skimage.color
@@ -21,6 +22,11 @@ from distutils.version import LooseVersion
 # URL from which to download the latest COCO trained weights
 COCO_MODEL_URL = "https://github.com/matterport/Mask_RCNN/releases/download/v2.0/mask_rcnn_coco.h5"
 
+# Lower bound of the IoU between a mask unmolded with the "opencv" resize
+# backend and the same mask unmolded with the "skimage" backend.
+# Verified by utils/ResizeBackendComparison.py
+OPENCV_RESIZE_MIN_MASK_IOU = 0.99
+
 
 ############################################################
 #  Bounding Boxes
@@ -141,7 +147,7 @@ def box_refinement_graph(box, gt_box):
     return result
 
 
-def resize_image(image, min_dim=None, max_dim=None, min_scale=None, mode="square"):
+def resize_image(image, min_dim=None, max_dim=None, min_scale=None, mode="square", backend="skimage"):
     """Resizes an image keeping the aspect ratio unchanged.
 
     min_dim: if provided, resizes the image such that it's smaller
@@ -163,6 +169,7 @@ def resize_image(image, min_dim=None, max_dim=None, min_scale=None, mode="square
               on min_dim and min_scale, then picks a random crop of
               size min_dim x min_dim. Can be used in training only.
               max_dim is not used in this mode.
+    backend: Library used for resizing, "skimage" or "opencv" (see resize())
 
     Returns:
     image: the resized image
@@ -200,7 +207,7 @@ def resize_image(image, min_dim=None, max_dim=None, min_scale=None, mode="square
 
     # Resize image using bilinear interpolation
     if scale != 1:
-        image = resize(image, (round(h * scale), round(w * scale)), preserve_range=True)
+        image = resize(image, (round(h * scale), round(w * scale)), preserve_range=True, backend=backend)
 
     # Need padding or cropping?
     if mode == "square":
@@ -247,7 +254,7 @@ def resize_image(image, min_dim=None, max_dim=None, min_scale=None, mode="square
     return image.astype(image_dtype), window, scale, padding, crop
 
 
-def unmold_mask(mask, bbox, image_shape):
+def unmold_mask(mask, bbox, image_shape, backend="skimage"):
     """Converts a mask generated by the neural network to a format similar
     to its original shape.
     mask: [height, width] of type float. A small, typically 28x28 mask.
@@ -255,10 +262,8 @@ def unmold_mask(mask, bbox, image_shape):
 
     Returns a binary mask with the same size as the original image.
     """
-    threshold = 0.5
     y1, x1, y2, x2 = bbox
-    mask = resize(mask, (y2 - y1, x2 - x1))
-    mask = np.where(mask >= threshold, 1, 0).astype(np.bool)
+    mask = unmold_mask_cropped(mask, bbox, backend)
 
     # Put the mask in the right location.
     full_mask = np.zeros(image_shape[:2], dtype=np.bool)
@@ -266,6 +271,20 @@ def unmold_mask(mask, bbox, image_shape):
     return full_mask
 
 
+def unmold_mask_cropped(mask, bbox, backend="skimage"):
+    """Converts a mask generated by the neural network to the size of its
+    bounding box.
+    mask: [height, width] of type float. A small, typically 28x28 mask.
+    bbox: [y1, x1, y2, x2]. The box to fit the mask in.
+
+    Returns a binary mask with the size of the bounding box.
+    """
+    threshold = 0.5
+    y1, x1, y2, x2 = bbox
+    mask = resize(mask, (y2 - y1, x2 - x1), backend=backend)
+    return np.where(mask >= threshold, 1, 0).astype(np.bool)
+
+
 ############################################################
 #  Anchors
 ############################################################
@@ -416,14 +435,23 @@ def denorm_boxes(boxes, shape):
     return np.around(np.multiply(boxes, scale) + shift).astype(np.int32)
 
 
-def resize(image, output_shape, order=1, mode="constant", cval=0, clip=True, preserve_range=False, anti_aliasing=False, anti_aliasing_sigma=None):
+def resize(image, output_shape, order=1, mode="constant", cval=0, clip=True, preserve_range=False, anti_aliasing=False, anti_aliasing_sigma=None, backend="skimage"):
     """A wrapper for Scikit-Image resize().
 
     Scikit-Image generates warnings on every call to resize() if it doesn't
     receive the right parameters. The right parameters depend on the version
     of skimage. This solves the problem by using different parameters per
     version. And it provides a central place to control resizing defaults.
+
+    backend: "skimage" or "opencv". The OpenCV backend is a lot faster and
+    keeps the dtype of the image (e.g. uint8 or float32) instead of working in
+    float64. It only supports what Mask R-CNN uses: bilinear interpolation with
+    a constant border, no anti aliasing and an image whose range is preserved.
     """
+    if backend == "opencv":
+        assert order == 1 and mode == "constant" and not anti_aliasing, "Only bilinear resizing with constant border is supported by the opencv backend"
+        assert preserve_range or image.dtype.kind == "f", "The opencv backend always preserves the range of the image"
+        return resize_opencv(image, output_shape, cval)
     if LooseVersion(skimage.__version__) >= LooseVersion("0.14"):
         # New in 0.14: anti_aliasing. Default it to False for backward
         # compatibility with skimage 0.13.
@@ -432,3 +460,21 @@ def resize(image, output_shape, order=1, mode="constant", cval=0, clip=True, pre
         )
     else:
         return skimage.transform.resize(image, output_shape, order=order, mode=mode, cval=cval, clip=clip, preserve_range=preserve_range)
+
+
+def resize_opencv(image, output_shape, cval=0):
+    """Bilinear resizing with OpenCV that samples the image the same way as
+    skimage.transform.resize() with mode="constant".
+
+    cv2.resize() repeats the edge pixels of the image, which shrinks masks
+    less at their borders than skimage does. So the scaling is done as an
+    affine warp with a constant border instead.
+    """
+    height, width = output_shape[:2]
+    scale_y = image.shape[0] / height
+    scale_x = image.shape[1] / width
+    # Maps pixel centers of the output onto the input
+    transformation = np.array([[scale_x, 0, 0.5 * scale_x - 0.5], [0, scale_y, 0.5 * scale_y - 0.5]])
+    return cv2.warpAffine(
+        image, transformation, (int(width), int(height)), flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_CONSTANT, borderValue=cval
+    )
@@ -15,8 +15,9 @@ import random
 import cv2
 import numpy as np
 
-from Constants import VIDEO_SCALE
+import Constants
 from data_model.Box import Box
+from data_model.CompactMask import CompactMask
 from data_model.DetectedObjects import DetectedObjects
 from utils.timer import timing
 
@@ -35,15 +36,18 @@ def random_colors(number_of_colors, bright=True):
     return colors
 
 
-def apply_mask(image, mask, color, alpha=0.5):
+def apply_mask(image, mask: CompactMask, color, alpha=0.5):
     """
     Apply the given mask to the image.
+    Only the part of the image within the bounding box of the mask is touched.
     Color an alpha can be customized
     """
+    frame_slices, mask_part = mask.clip_to_frame(image.shape)
+    image_part = image[frame_slices]
     for channel in range(3):
-        image[:, :, channel] = np.where(mask == 1,
-                                        image[:, :, channel] * (1 - alpha) + alpha * color[channel],
-                                        image[:, :, channel])
+        image_part[:, :, channel] = np.where(mask_part,
+                                             image_part[:, :, channel] * (1 - alpha) + alpha * color[channel],
+                                             image_part[:, :, channel])
     return image
 
 
@@ -69,16 +73,21 @@ def draw_instances(
     show_3d_position=False,
     show_kalman_next_prediction_area=False,
     show_kalman_last_prediction_area=True,
+    interpolated_frame=False,
 ):
     """
     image: image to copy and illustrate on
     detected_objects: objects to draw
     show_x: Display various features
+    interpolated_frame: marks the frame as interpolated (no detection has been run)
     """
 
     result_image = image.copy()
 
-    for obj_id, obj_track in detected_objects.objects.items():
+    if interpolated_frame:
+        cv2.putText(result_image, "interpolated", (5, 15), fontFace=cv2.FONT_HERSHEY_SIMPLEX, fontScale=0.5, color=(0, 0, 255), thickness=1, lineType=cv2.LINE_AA)
+
+    for obj_id, obj_track in detected_objects.active_objects.items():
 
         if obj_track.is_present() and not filtered(obj_track.class_name):
 
@@ -86,7 +95,7 @@ def draw_instances(
             print(
                 f"{obj_track.class_name}, "
                 f"id: {obj_id}, "
-                f"tracked for {len(obj_track.occurrences)} frames, "
+                f"tracked for {obj_track.get_number_of_occurrences()} frames, "
                 f"3D pos: {tuple(map(lambda e: round(e, 2), current_instance.get_3d_position()))}, "
                 f"distance: {current_instance.approximate_distance() :.2f}m, "
                 f"velocity: {tuple(map(lambda e: round(e, 2), current_instance.velocity)) if current_instance.velocity is not None else 'None'}, "
@@ -118,14 +127,14 @@ def draw_instances(
                 cv2.putText(result_image, label_text, (box.x1, box.y1 - 1), fontFace=cv2.FONT_HERSHEY_SIMPLEX, fontScale=0.4, color=(0, 0, 255), thickness=1, lineType=cv2.LINE_AA)
 
             # Mask
-            if show_mask:
+            if show_mask and current_instance.mask is not None:
                 mask = current_instance.mask
                 result_image = apply_mask(result_image, mask, color)
 
             velocity = current_instance.velocity
-            if show_trajectory and velocity and len(obj_track.occurrences) > 4:
+            if show_trajectory and velocity and obj_track.get_number_of_occurrences() > 4:
                 # Trajectory based on velocity (amplified for better visualization)
-                visualization_factor = 30 * VIDEO_SCALE
+                visualization_factor = 30 * Constants.VIDEO_SCALE
                 center = box.get_center()
                 arrow_head = (int(center[0] + velocity[0] * visualization_factor), int(center[1] + velocity[1] * visualization_factor))
                 cv2.arrowedLine(result_image, center, arrow_head, (0, 0, 255), 2)
@@ -159,7 +168,7 @@ def draw_depth_map(image, detected_objects: DetectedObjects, show_distance=False
 
     depth_image = np.zeros(image.shape, dtype=np.uint8)
 
-    for obj_track in detected_objects.objects.values():
+    for obj_track in detected_objects.active_objects.values():
 
         if obj_track.is_present():
 
@@ -182,7 +191,8 @@ def draw_depth_map(image, detected_objects: DetectedObjects, show_distance=False
 
             # Mask
             mask = current_instance.mask
-            depth_image = apply_mask(depth_image, mask, color, alpha=1)
+            if mask is not None:
+                depth_image = apply_mask(depth_image, mask, color, alpha=1)
 
     return depth_image
 
@@ -0,0 +1,30 @@
+import numpy as np
+
+from matcher.assignment_utils import assign_by_similarity
+
+MIN_SIMILARITY = 0.3
+
+
+def test_very_similar_pair_wins_over_more_barely_similar_pairs():
+    # Detections A, B and tracks X, Y: A-X 0.95, A-Y 0.35, B-X 0.35, B-Y not similar
+    similarities = np.array([[0.95, 0.35],
+                             [0.35, 0.0]])
+    assert assign_by_similarity(similarities, MIN_SIMILARITY) == {0: 0}
+
+
+def test_pairs_of_at_most_min_similarity_are_not_assigned():
+    similarities = np.array([[0.3, 0.1],
+                             [0.8, 0.31]])
+    assert assign_by_similarity(similarities, MIN_SIMILARITY) == {1: 0}
+
+
+def test_assigns_every_detection_once_maximizing_the_summed_similarity():
+    similarities = np.array([[0.9, 0.8, 0.0],
+                             [0.85, 0.4, 0.0],
+                             [0.0, 0.0, 0.0]])
+    assert assign_by_similarity(similarities, MIN_SIMILARITY) == {0: 1, 1: 0}
+
+
+def test_no_detections_or_tracks():
+    assert assign_by_similarity(np.zeros((0, 2)), MIN_SIMILARITY) == {}
+    assert assign_by_similarity(np.zeros((2, 0)), MIN_SIMILARITY) == {}
@@ -0,0 +1,40 @@
+import pytest
+
+from Constants import VelocitySmoothing
+from data_model.VelocityAccumulator import VelocityAccumulator
+
+FPS = 30
+TRANSLATION_PER_FRAME = (0.1, -0.05, 0.2)  # in meter
+
+
+def get_velocity_of_detections_every_third_frame(smoothing: VelocitySmoothing) -> tuple:
+    """
+    Feeds the translations of an object moving at a steady speed that is only detected every third frame, like
+    ObjectTrack with --detectEvery 3: None for the first occurrence and the interpolated frames, the translation since
+    the last detection otherwise
+    """
+    accumulator = VelocityAccumulator(window_size=FPS, fps=FPS, smoothing=smoothing)
+    translation = tuple(3 * e for e in TRANSLATION_PER_FRAME)
+    for translation_or_none in [None, None, None, translation, None, None, translation]:
+        accumulator.add(translation_or_none)
+    return accumulator.get_velocity()
+
+
+@pytest.mark.parametrize("smoothing", list(VelocitySmoothing))
+def test_translations_spanning_several_frames_give_the_steady_velocity(smoothing):
+    velocity = get_velocity_of_detections_every_third_frame(smoothing)
+    assert velocity == pytest.approx(tuple(e * FPS for e in TRANSLATION_PER_FRAME))
+
+
+def test_window_and_exponential_smoothing_agree_at_steady_speed():
+    window_velocity = get_velocity_of_detections_every_third_frame(VelocitySmoothing.WINDOW)
+    exponential_velocity = get_velocity_of_detections_every_third_frame(VelocitySmoothing.EXPONENTIAL)
+    assert exponential_velocity == pytest.approx(window_velocity)
+
+
+def test_exponential_smoothing_of_consecutive_translations():
+    accumulator = VelocityAccumulator(window_size=FPS, fps=FPS, smoothing=VelocitySmoothing.EXPONENTIAL)
+    accumulator.add(None)  # first occurrence
+    for _ in range(5):
+        accumulator.add(TRANSLATION_PER_FRAME)
+    assert accumulator.get_velocity() == pytest.approx(tuple(e * FPS for e in TRANSLATION_PER_FRAME))
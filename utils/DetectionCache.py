@@ -0,0 +1,135 @@
+"""
+Detection Cache
+
+Persists the results of Mask R-CNN on disk, so that repeated runs on the same input (e.g. while tuning the tracker or
+comparing matchers) don't have to run the detection again.
+Entries are content addressed: their key combines a hash of the input, the position of the frame (timestamp in
+milliseconds for videos, image number for images) and all configuration values that influence the result of the
+detection.
+"""
+import hashlib
+import json
+import os
+from typing import Optional
+
+import numpy as np
+
+from Constants import ROOT_DIR
+from data_model.CompactMask import CompactMask
+from utils.image_utils import get_image_paths
+from utils.timer import timing
+
+CACHE_DIR = os.path.join(ROOT_DIR, "export/detection_cache")
+
+# Configuration values of Mask R-CNN which change the detection results
+CONFIG_FIELDS = [
+    "NAME",
+    "BACKBONE",
+    "NUM_CLASSES",
+    "COMPACT_MASKS",
+    "IMAGE_RESIZE_MODE",
+    "IMAGE_MIN_DIM",
+    "IMAGE_MAX_DIM",
+    "IMAGE_MIN_SCALE",
+    "MEAN_PIXEL",
+    "RESIZE_BACKEND",
+    "RPN_ANCHOR_SCALES",
+    "RPN_ANCHOR_RATIOS",
+    "RPN_NMS_THRESHOLD",
+    "PRE_NMS_LIMIT",
+    "POST_NMS_ROIS_INFERENCE",
+    "DETECTION_MAX_INSTANCES",
+    "DETECTION_MIN_CONFIDENCE",
+    "DETECTION_NMS_THRESHOLD",
+]
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class DetectionCache:
+    """
+    Class storing the results of Mask R-CNN for each frame of an input in a compact form.
+    Masks are expected as CompactMasks (config.COMPACT_MASKS) and stored bit packed.
+    """
+
+    def __init__(self, input_path, config, extra_key=None, cache_dir=CACHE_DIR):
+        """
+        :param input_path: video file or directory of images the detections belong to
+        :param config: Mask R-CNN configuration the detections are made with
+        :param extra_key: dict of further values that change the frames handed to the detection (e.g. undistortion)
+        :param cache_dir: directory in which the entries are stored
+        """
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+        config_values = {name: getattr(config, name) for name in CONFIG_FIELDS}
+        self.base_key = json.dumps({"input": hash_input(input_path), "config": config_values, "extra": extra_key or {}}, sort_keys=True, default=str)
+
+    @timing
+    def load(self, frame_index: int) -> Optional[dict]:
+        """
+        :returns the cached detection result of the frame in the format of Mask R-CNN or None if there is none
+        """
+        path = self._get_path(frame_index)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as entry:
+            frame_shape = tuple(entry["frame_shape"])
+            packed_masks = entry["packed_masks"]
+            mask_offsets = entry["mask_offsets"]
+            masks = []
+            for i, (y1, x1, height, width) in enumerate(entry["mask_boxes"]):
+                packed_mask = packed_masks[mask_offsets[i]: mask_offsets[i + 1]]
+                cropped_mask = np.unpackbits(packed_mask, count=height * width).reshape((height, width)).astype(bool)
+                masks.append(CompactMask(int(y1), int(x1), cropped_mask, frame_shape))
+            return {
+                "rois": entry["rois"],
+                "class_ids": entry["class_ids"],
+                "scores": entry["scores"],
+                "masks": masks,
+            }
+
+    @timing
+    def store(self, frame_index: int, result: dict):
+        """
+        Writes a detection result of Mask R-CNN for the frame to disk
+        """
+        masks: [CompactMask] = result["masks"]
+        packed_masks = [np.packbits(mask.cropped_mask) for mask in masks]
+        mask_offsets = np.cumsum([0] + [len(packed_mask) for packed_mask in packed_masks])
+        mask_boxes = np.array([(mask.y1, mask.x1) + mask.cropped_mask.shape for mask in masks], dtype=np.int32).reshape((-1, 4))
+        frame_shape = masks[0].frame_shape if masks else (0, 0)
+
+        path = self._get_path(frame_index)
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "wb") as file:
+            np.savez_compressed(
+                file,
+                rois=result["rois"],
+                class_ids=result["class_ids"],
+                scores=result["scores"],
+                frame_shape=np.array(frame_shape),
+                mask_boxes=mask_boxes,
+                packed_masks=np.concatenate(packed_masks) if packed_masks else np.empty(0, dtype=np.uint8),
+                mask_offsets=mask_offsets.astype(np.int64),
+            )
+        # Replacing makes sure that runs which are interrupted never leave half written entries behind
+        os.replace(temporary_path, path)
+
+    def _get_path(self, frame_index: int) -> str:
+        key = hashlib.sha1(f"{self.base_key}/{frame_index}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, key + ".npz")
+
+
+def hash_input(input_path) -> str:
+    """
+    :returns a hash over the content of a video file or all images of a directory
+    """
+    input_hash = hashlib.sha1()
+    paths = get_image_paths(input_path) if os.path.isdir(input_path) else [input_path]
+    for path in paths:
+        input_hash.update(os.path.basename(path).encode())
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+                input_hash.update(chunk)
+    return input_hash.hexdigest()
+
@@ -0,0 +1,87 @@
+"""
+Prefetching Frame Source
+
+Reads frames of a video or image directory ahead of time in background threads, so that decoding, color conversion
+and undistortion of the upcoming frames overlap with the processing of the current frame.
+"""
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from Constants import VideoReaderType
+from data_model.Frame import Frame
+from utils.image_utils import get_frame_loader
+
+# Marks that the reader thread has passed on all frames
+_END_OF_FRAMES = object()
+# Interval in seconds in which a blocked reader checks whether it should stop
+_STOP_CHECK_INTERVAL = 0.1
+
+
+class PrefetchingFrameSource:
+    """
+    Iterable that yields the frames of the input as Frame objects in their original order.
+    A reader thread decodes the input sequentially while number_of_threads decode threads convert and undistort the
+    frames. At most queue_size frames are kept ahead of the consumer.
+    """
+
+    def __init__(self, input_type, path, from_sec_or_image=0, to_sec_or_image=None, undistort=False, number_of_threads=2, queue_size=8, video_reader=VideoReaderType.OPENCV):
+        self.input_type = input_type
+        self.path = path
+        self.from_sec_or_image = from_sec_or_image
+        self.to_sec_or_image = to_sec_or_image
+        self.undistort = undistort
+        self.number_of_threads = max(1, number_of_threads)
+        self.queue_size = max(1, queue_size)
+        self.video_reader = video_reader
+
+    def __iter__(self):
+        raw_frames, prepare_frame = get_frame_loader(self.input_type, self.path, self.from_sec_or_image, self.to_sec_or_image, self.undistort, self.video_reader)
+        pending_frames = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=self.number_of_threads, thread_name_prefix="frame_decoder")
+        reader = threading.Thread(target=self._read_frames, args=(raw_frames, prepare_frame, executor, pending_frames, stop), daemon=True)
+        reader.start()
+        try:
+            while True:
+                item = pending_frames.get()
+                if item is _END_OF_FRAMES:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                frame_number, timestamp, future = item
+                yield Frame(frame_number, future.result(), timestamp)
+        finally:
+            # Also reached if the consumer stops early, so the reader must not block on a full queue forever
+            stop.set()
+            reader.join()
+            executor.shutdown(wait=True)
+
+    def _read_frames(self, raw_frames, prepare_frame, executor, pending_frames, stop):
+        """
+        Runs in the reader thread: hands every raw frame to the decode threads and queues the pending results in
+        order of the frames. Errors are passed on to the consumer.
+        """
+        try:
+            for frame_number, (timestamp, raw_frame) in enumerate(raw_frames):
+                future = executor.submit(prepare_frame, raw_frame)
+                if not self._put(pending_frames, (frame_number, timestamp, future), stop):
+                    return
+        except Exception as e:
+            self._put(pending_frames, e, stop)
+            return
+        self._put(pending_frames, _END_OF_FRAMES, stop)
+
+    @staticmethod
+    def _put(pending_frames, item, stop) -> bool:
+        """
+        Blocks until the item could be queued or the consumer is gone.
+        :returns whether the item has been queued
+        """
+        while not stop.is_set():
+            try:
+                pending_frames.put(item, timeout=_STOP_CHECK_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
@@ -49,7 +49,7 @@ def read_kitti_label_file(frame: str):
 
 def detected_objects_to_data_frame(detected_objects: DetectedObjects):
     df_detected_objects = pd.DataFrame(columns=["type", "bbox_left", "bbox_top", "bbox_right", "bbox_bottom", "location_x", "location_y", "location_z"])
-    for obj_track in detected_objects.objects.values():
+    for obj_track in detected_objects.get_all_object_tracks().values():
         type = obj_track.class_name
         instance = obj_track.get_current_instance()
         bbox_left = instance.roi.x1
@@ -9,29 +9,23 @@ import os
 
 import cv2
 
-from Constants import ROOT_DIR
-
-from Constants import MATCHER_TYPE, MatcherType
-
-if MATCHER_TYPE == MatcherType.SIFT:
-    from matcher.SiftMatcher import get_matches
-elif MATCHER_TYPE == MatcherType.SURF:
-    from matcher.SurfMatcher import get_matches
-else:
-    from matcher.OrbMatcher import get_matches
-
+from Constants import ROOT_DIR, MatcherType
 from data_model.DetectedObjects import DetectedObjects
 from data_model.ObjectInstance import create_objects
+from matcher.MatcherStrategy import MatcherStrategy
+from matcher.keypoint_utils import to_cv_keypoints
 from mrcnn.Mask_R_CNN_COCO import detect
 from utils.image_utils import show
 import numpy as np
 
 IMAGE_PATH_1 = os.path.join(ROOT_DIR, "data/testImages/000000.png")
 IMAGE_PATH_2 = os.path.join(ROOT_DIR, "data/testImages/000001.png")
+MATCHER_TYPE = MatcherType.SIFT
 
 if __name__ == "__main__":
 
-    detected_objects = DetectedObjects()
+    matcher = MatcherStrategy(MATCHER_TYPE)
+    detected_objects = DetectedObjects(matcher)
 
     image_1 = cv2.imread(IMAGE_PATH_1)
     image_2 = cv2.imread(IMAGE_PATH_2)
@@ -41,8 +35,8 @@ if __name__ == "__main__":
     print("detecting objects in image 2")
     result_2 = detect(image_2)
 
-    objects_1 = create_objects(result_1, image_1)
-    objects_2 = create_objects(result_2, image_2)
+    objects_1 = create_objects(result_1, image_1, matcher)
+    objects_2 = create_objects(result_2, image_2, matcher)
 
     if not objects_1 or not objects_2:
         print("Not enough objects found")
@@ -50,7 +44,7 @@ if __name__ == "__main__":
     detected_objects.add_objects(objects_1)
     detected_objects.add_objects(objects_2)
 
-    for obj_id, detected_object in detected_objects.objects.items():
+    for obj_id, detected_object in detected_objects.get_all_object_tracks().items():
         if len(detected_object.occurrences) == 2 \
                 and detected_object.occurrences[0] is not None \
                 and detected_object.occurrences[1] is not None:
@@ -59,6 +53,6 @@ if __name__ == "__main__":
             obj_instance_2 = detected_object.occurrences[1]
 
             for dist in np.linspace(100, 1000, 5):
-                matches = get_matches(obj_instance_1.descriptors, obj_instance_2.descriptors, dist)
-                image_with_matches = cv2.drawMatches(image_1, obj_instance_1.keypoints, image_2, obj_instance_2.keypoints, matches, None)
+                matches = matcher.get_matches(obj_instance_1.descriptors, obj_instance_2.descriptors, dist)
+                image_with_matches = cv2.drawMatches(image_1, to_cv_keypoints(obj_instance_1.keypoints), image_2, to_cv_keypoints(obj_instance_2.keypoints), matches, None)
                 show(image_with_matches, "Matches: dist=" + str(dist), await_keypress=True)
@@ -0,0 +1,370 @@
+"""
+Matcher Benchmark
+
+Helper script that compares the matchers and their backends on KITTI images and the sample video.
+1. Backends: brute force and FLANN matching with an increasing number of descriptors per object, reporting the
+   crossover point from which on FLANN is faster. Like during tracking, the references of several object tracks are
+   matched against a new object in every frame, so one FLANN index is built per frame (see matcher/flann_utils.py).
+   The other frames only save the index of the previous object, which the first frame has to build as well.
+2. Matchers: keypoints/s of the feature extraction, matches/s of the keypoint matching and the tracking quality on
+   consecutive frames of the sample video, in which two cars labelled in the first frame approach the camera. Their
+   boxes are followed by optical flow, independent of the matchers.
+3. With --calibrate: the distances of the binary matchers (AKAZE, BRISK) that correspond to the ones of ORB, measured
+   on the true matches of the same sequence.
+Only used for verification purposes.
+"""
+
+import argparse
+import os
+from time import time
+
+import cv2
+import numpy as np
+from tabulate import tabulate
+
+from Constants import ROOT_DIR, MatcherBackend, MatcherType
+from data_model.CompactMask import CompactMask
+from data_model.DetectedObjects import DetectedObjects
+from data_model.ObjectInstance import create_objects
+from matcher.MatcherStrategy import MatcherStrategy
+from matcher.optical_flow_utils import track_points
+from utils.VideoReader import OpenCvVideoReader
+
+REFERENCE_IMAGE_PATH = os.path.join(ROOT_DIR, "data/imageSet/kitti/1000/000000.png")
+QUERY_IMAGE_PATH = os.path.join(ROOT_DIR, "data/imageSet/kitti/1000/000001.png")
+NUMBERS_OF_DESCRIPTORS = [100, 250, 500, 1000, 2000, 4000]
+
+VIDEO_PATH = os.path.join(ROOT_DIR, "data/video/IMG_5823.mov")
+# Second of the video (60 frames per second) in which two cars approach the static camera
+CLIP_INTERVAL = (0.5, 1.5)
+# Cars in the first frame of the clip as (y1, x1, y2, x2), the silver one on the left is partly occluded by the dark one
+LABELLED_BOXES = [(90, 207, 136, 275), (90, 174, 126, 212)]
+CAR_CLASS_ID = 3  # COCO class id
+# Largest distance in pixel between a keypoint followed by optical flow and its true match in the next frame
+MAX_TRUE_MATCH_OFFSET = 2
+BINARY_MATCHER_TYPES = [MatcherType.ORB, MatcherType.AKAZE, MatcherType.BRISK]
+
+# Name of the index and feature detector (given the matcher module) of the matchers whose backends are compared
+BACKEND_BENCHMARKS = {
+    MatcherType.ORB: ("ORB (LSH)", lambda matcher_module: cv2.ORB_create(max(NUMBERS_OF_DESCRIPTORS))),
+    MatcherType.AKAZE: ("AKAZE (LSH)", lambda matcher_module: matcher_module.AKAZE),
+    MatcherType.BRISK: ("BRISK (LSH)", lambda matcher_module: matcher_module.BRISK),
+    MatcherType.SIFT: ("SIFT (KD-trees)", lambda matcher_module: matcher_module.SIFT),
+}
+
+
+def extract_descriptors(feature_detector, image_path, max_features):
+    """
+    :returns descriptors of the max_features keypoints with the strongest response in the image
+    """
+    gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    keypoints = sorted(feature_detector.detect(gray, None), key=lambda keypoint: keypoint.response, reverse=True)[:max_features]
+    return feature_detector.compute(gray, keypoints)[1]
+
+
+def time_matching(matcher_module, backend: MatcherBackend, descriptors_a, descriptor_b, number_of_frames: int):
+    """
+    Matches the reference descriptors against the descriptors of a new object in every frame (a copy of descriptor_b,
+    so that each gets an index of its own) and the new object against the one of the previous frame, starting without
+    cached indexes.
+    :returns tuple of the time of the first frame (incl. indexing the new and the previous object) and the mean time of
+    the other frames (incl. indexing the new object)
+    """
+    matcher_module.FLANN_INDEXES.clear()
+    durations = []
+    previous_descriptor_b = descriptors_a[0]
+    for _ in range(number_of_frames):
+        new_descriptor_b = descriptor_b.copy()
+        start = time()
+        matcher_module.average_descriptor_distances(descriptors_a, new_descriptor_b, backend)
+        matcher_module.get_matches(new_descriptor_b, previous_descriptor_b, backend=backend)
+        durations.append(time() - start)
+        previous_descriptor_b = new_descriptor_b
+    return durations[0], sum(durations[1:]) / max(1, len(durations) - 1)
+
+
+def benchmark_backends(name, matcher_module, feature_detector, number_of_references=5, number_of_frames=10):
+    """
+    Prints the time per frame of both backends for every number of descriptors and the crossover point
+    """
+    rows = []
+    crossover = None
+    for number_of_descriptors in NUMBERS_OF_DESCRIPTORS:
+        descriptor_a = extract_descriptors(feature_detector, REFERENCE_IMAGE_PATH, number_of_descriptors)
+        descriptor_b = extract_descriptors(feature_detector, QUERY_IMAGE_PATH, number_of_descriptors)
+        if rows and rows[-1][0] == len(descriptor_a):
+            break  # the detector finds no more keypoints
+        # Copies, like the references of different tracks
+        descriptors_a = [descriptor_a.copy() for _ in range(number_of_references)]
+        _, brute_force = time_matching(matcher_module, MatcherBackend.BRUTE_FORCE, descriptors_a, descriptor_b, number_of_frames)
+        flann_first_frame, flann = time_matching(matcher_module, MatcherBackend.FLANN, descriptors_a, descriptor_b, number_of_frames)
+        if crossover is None and flann < brute_force:
+            crossover = len(descriptor_a)
+        rows.append([len(descriptor_a), f"{brute_force * 1000:.2f}", f"{flann_first_frame * 1000:.2f}", f"{flann * 1000:.2f}"])
+
+    print(f"{name}: {number_of_references} references matched per frame over {number_of_frames} frames [ms per frame]")
+    print(tabulate(rows, headers=["descriptors", "brute force", "FLANN first frame", "FLANN other frames"]))
+    if crossover is None:
+        print(f"{name}: FLANN is not faster up to {rows[-1][0]} descriptors\n")
+    else:
+        print(f"{name}: FLANN is faster from about {crossover} descriptors per object on\n")
+
+
+def read_clip():
+    """
+    :returns list of the frames (BGR) of the video that start within CLIP_INTERVAL
+    """
+    return [frame for _, frame in OpenCvVideoReader(VIDEO_PATH).frames(*CLIP_INTERVAL)]
+
+
+def follow_boxes(grayscale_frames, boxes):
+    """
+    Follows the boxes through the frames by the median optical flow of points in their inner half (which excludes the
+    background), the change of the distances between the points yields how much the approaching cars grow. As it does
+    not depend on any of the matchers, this serves as ground truth.
+    :returns list with an array of the boxes (y1, x1, y2, x2) for every frame
+    """
+    boxes_per_frame = [np.array(boxes, dtype=np.float64)]
+    for previous_gray, gray in zip(grayscale_frames, grayscale_frames[1:]):
+        next_boxes = []
+        for y1, x1, y2, x2 in boxes_per_frame[-1]:
+            quarter_height, quarter_width = (y2 - y1) / 4, (x2 - x1) / 4
+            search_mask = np.zeros(gray.shape, dtype=np.uint8)
+            search_mask[int(y1 + quarter_height):int(y2 - quarter_height), int(x1 + quarter_width):int(x2 - quarter_width)] = 255
+            points = cv2.goodFeaturesToTrack(previous_gray, 200, 0.01, 3, mask=search_mask).reshape(-1, 2)
+            tracked_points, reliable = track_points(previous_gray, gray, points)
+            points, tracked_points = points[reliable], tracked_points[reliable]
+            offset_x, offset_y = np.median(tracked_points - points, axis=0)
+            first, second = np.triu_indices(len(points), 1)
+            distances = np.linalg.norm(points[first] - points[second], axis=1)
+            tracked_distances = np.linalg.norm(tracked_points[first] - tracked_points[second], axis=1)
+            scale = np.median(tracked_distances[distances > 5] / distances[distances > 5])
+            center_y, center_x = (y1 + y2) / 2 + offset_y, (x1 + x2) / 2 + offset_x
+            half_height, half_width = (y2 - y1) * scale / 2, (x2 - x1) * scale / 2
+            next_boxes.append((center_y - half_height, center_x - half_width, center_y + half_height, center_x + half_width))
+        boxes_per_frame.append(np.array(next_boxes))
+    return boxes_per_frame
+
+
+def generate_sequence(frames, boxes_per_frame):
+    """
+    :returns list of tuples of a frame and the detection result of its boxes in the format of Mask R-CNN
+    """
+    sequence = []
+    for frame, boxes in zip(frames, boxes_per_frame):
+        height, width = frame.shape[:2]
+        rois, masks = [], []
+        for box in boxes:
+            y1, x1, y2, x2 = np.clip(np.round(box).astype(int), 0, [height, width, height, width])
+            rois.append((y1, x1, y2, x2))
+            masks.append(CompactMask(y1, x1, np.ones((y2 - y1, x2 - x1), dtype=bool), (height, width)))
+        result = {"rois": np.array(rois),
+                  "class_ids": np.full(len(boxes), CAR_CLASS_ID),
+                  "scores": np.ones(len(boxes)),
+                  "masks": masks}
+        sequence.append((frame, result))
+    return sequence
+
+
+def get_centers(boxes) -> np.ndarray:
+    """
+    :returns (N, 2) centers (x, y) of the boxes (y1, x1, y2, x2)
+    """
+    return np.stack([boxes[:, 1] + boxes[:, 3], boxes[:, 0] + boxes[:, 2]], axis=1) / 2
+
+
+def load_sequence():
+    """
+    :returns tuple of the sequence of the clip with the labelled cars and their boxes in every frame
+    """
+    frames = read_clip()
+    boxes_per_frame = follow_boxes([cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in frames], LABELLED_BOXES)
+    return generate_sequence(frames, boxes_per_frame), boxes_per_frame
+
+
+def extract_objects(matcher: MatcherStrategy, sequence):
+    """
+    :returns tuple of the object instances with features of every frame and the time it took to extract them
+    """
+    instances_per_frame = []
+    extraction_time = 0.0
+    for frame, result in sequence:
+        start = time()
+        instances_per_frame.append(create_objects(result, frame, matcher))
+        extraction_time += time() - start
+    return instances_per_frame, extraction_time
+
+
+def evaluate_matcher(matcher: MatcherStrategy, sequence, boxes_per_frame):
+    """
+    Tracks the objects of the sequence with the matcher.
+    :returns list of keypoints/s, matches/s, share of correct associations, number of object tracks, mean similarity
+    of consecutive instances of the same and of different objects, mean translation error in pixel and share of
+    consecutive occurrences without any match
+    """
+    instances_per_frame, extraction_time = extract_objects(matcher, sequence)
+    number_of_keypoints = sum(len(obj.keypoints) for objects in instances_per_frame for obj in objects)
+    detected_objects = DetectedObjects(matcher)
+    track_ids_per_frame = []
+    for objects in instances_per_frame:
+        detected_objects.add_objects(objects)
+        track_id_of_instance = {id(obj_track.get_current_instance()): obj_id for obj_id, obj_track in detected_objects.get_active_object_tracks().items()}
+        track_ids_per_frame.append([track_id_of_instance.get(id(obj)) for obj in objects])
+
+    matching_time, number_of_matches = 0.0, 0
+    correct_associations, translation_errors, pairs_without_matches = 0, [], 0
+    similarities, similarities_to_others = [], []
+    for frame_number in range(1, len(sequence)):
+        reference_translations = get_centers(boxes_per_frame[frame_number]) - get_centers(boxes_per_frame[frame_number - 1])
+        last_instances = instances_per_frame[frame_number - 1]
+        for i, (current, last) in enumerate(zip(instances_per_frame[frame_number], last_instances)):
+            if track_ids_per_frame[frame_number][i] == track_ids_per_frame[frame_number - 1][i]:
+                correct_associations += 1
+            similarities.append(last.similarity_to(current, matcher))
+            similarities_to_others += [other.similarity_to(current, matcher) for other in last_instances if other is not last]
+            if current.descriptors is None or last.descriptors is None:
+                pairs_without_matches += 1
+                continue
+            start = time()
+            matches = matcher.get_matches(current.descriptors, last.descriptors)
+            matching_time += time() - start
+            number_of_matches += len(matches)
+            if not matches:
+                pairs_without_matches += 1
+                continue
+            translations = current.keypoints["pt"][[m.queryIdx for m in matches]] - last.keypoints["pt"][[m.trainIdx for m in matches]]
+            translation_errors.append(np.linalg.norm(translations.mean(axis=0) - reference_translations[i]))
+
+    number_of_pairs = sum(len(objects) for objects in instances_per_frame[1:])
+    return [f"{number_of_keypoints / extraction_time:.0f}",
+            f"{number_of_matches / matching_time:.0f}" if matching_time > 0 else "-",
+            f"{correct_associations / number_of_pairs:.2f}",
+            detected_objects.get_number_of_object_tracks(),
+            f"{np.mean(similarities):.2f}",
+            f"{np.mean(similarities_to_others):.2f}",
+            f"{np.mean(translation_errors):.2f}" if translation_errors else "-",
+            f"{pairs_without_matches / number_of_pairs:.2f}"]
+
+
+def get_true_match_distances(current, last, previous_gray, gray) -> np.ndarray:
+    """
+    Follows the keypoints of the last instance into the frame of the current one by optical flow. The keypoint of the
+    current instance of about the same size and orientation that lies within MAX_TRUE_MATCH_OFFSET pixel is their true
+    match.
+    :returns Hamming distances of the descriptors of all true matches
+    """
+    tracked_points, reliable = track_points(previous_gray, gray, last.keypoints["pt"])
+    distances = []
+    for i in np.flatnonzero(reliable):
+        offsets = np.linalg.norm(current.keypoints["pt"] - tracked_points[i], axis=1)
+        size_ratios = current.keypoints["size"] / last.keypoints["size"][i]
+        angle_differences = np.abs((current.keypoints["angle"] - last.keypoints["angle"][i] + 180) % 360 - 180)
+        offsets[(size_ratios < 0.8) | (size_ratios > 1.25) | (angle_differences > 15)] = np.inf
+        j = np.argmin(offsets)
+        if offsets[j] < MAX_TRUE_MATCH_OFFSET:
+            distances.append(cv2.norm(last.descriptors[i], current.descriptors[j], cv2.NORM_HAMMING))
+    return np.array(distances)
+
+
+def measure_binary_matcher(matcher: MatcherStrategy, sequence):
+    """
+    :returns tuple of the Hamming distances of all true matches and of the mean (not normalized) average descriptor
+    distance of consecutive instances of the same object
+    """
+    instances_per_frame, _ = extract_objects(matcher, sequence)
+    grayscale_frames = [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame, _ in sequence]
+    true_match_distances, average_distances = [], []
+    for frame_number in range(1, len(sequence)):
+        for current, last in zip(instances_per_frame[frame_number], instances_per_frame[frame_number - 1]):
+            true_match_distances.append(get_true_match_distances(current, last, grayscale_frames[frame_number - 1], grayscale_frames[frame_number]))
+            average_distance = matcher.module.average_descriptor_distances([last.descriptors], current.descriptors, MatcherBackend.BRUTE_FORCE)[0]
+            if average_distance != 100:  # no match
+                average_distances.append(average_distance * matcher.module.DISTANCE_NORMALIZATION)
+    return np.concatenate(true_match_distances), np.mean(average_distances)
+
+
+def calibrate_binary_matchers(matcher_types, sequence):
+    """
+    Prints the distances of the binary matchers that correspond to the ones of ORB, measured on true matches:
+    MAX_MATCH_DISTANCE keeps the same share of the true matches as ORB's and DISTANCE_NORMALIZATION leads to the same
+    mean similarity of consecutive instances of the same object.
+    """
+    orb_matcher = get_matcher(MatcherType.ORB)
+    orb_true_match_distances, orb_average_distance = measure_binary_matcher(orb_matcher, sequence)
+    share_of_kept_matches = np.mean(orb_true_match_distances <= orb_matcher.module.MAX_MATCH_DISTANCE)
+    rows = []
+    for matcher_type in matcher_types:
+        matcher = get_matcher(matcher_type) if matcher_type in BINARY_MATCHER_TYPES else None
+        if matcher is None:
+            continue
+        true_match_distances, average_distance = measure_binary_matcher(matcher, sequence)
+        rows.append([str(matcher_type), len(true_match_distances), f"{np.median(true_match_distances):.0f}",
+                     f"{np.quantile(true_match_distances, share_of_kept_matches):.0f}",
+                     f"{orb_matcher.module.DISTANCE_NORMALIZATION * average_distance / orb_average_distance:.0f}"])
+
+    print(f"\nDistances of true matches on consecutive frames, ORB keeps {share_of_kept_matches:.0%} of them")
+    print(tabulate(rows, headers=["matcher", "true matches", "median distance", "MAX_MATCH_DISTANCE", "DISTANCE_NORMALIZATION"]))
+
+
+def get_matcher(matcher_type: MatcherType):
+    """
+    :returns the matcher of the matcher type, whose module is only imported now, or None if it is not available
+    """
+    try:
+        return MatcherStrategy(matcher_type)
+    except (AttributeError, cv2.error) as e:  # e.g. SURF, AKAZE or BRISK are not part of every OpenCV build
+        print(f"{matcher_type} skipped: {e}")
+        return None
+
+
+def benchmark_all_backends(matcher_types):
+    """
+    Compares the backends of every available matcher of the matcher types
+    """
+    for matcher_type in matcher_types:
+        if matcher_type not in BACKEND_BENCHMARKS:
+            continue
+        matcher = get_matcher(matcher_type)
+        if matcher is not None:
+            name, get_feature_detector = BACKEND_BENCHMARKS[matcher_type]
+            benchmark_backends(name, matcher.module, get_feature_detector(matcher.module))
+
+
+def benchmark_matchers(matcher_types, sequence, boxes_per_frame):
+    """
+    Prints throughput and tracking quality of every available matcher of the matcher types
+    """
+    rows = []
+    for matcher_type in matcher_types:
+        matcher = get_matcher(matcher_type)
+        if matcher is None:
+            continue
+        rows.append([str(matcher_type)] + evaluate_matcher(matcher, sequence, boxes_per_frame))
+
+    print(f"\n{len(LABELLED_BOXES)} approaching cars over {len(sequence)} consecutive frames of {os.path.basename(VIDEO_PATH)}")
+    print(tabulate(rows, headers=["matcher", "keypoints/s", "matches/s", "correct associations", "object tracks", "similarity",
+                                  "similarity to others", "translation error [px]", "no matches"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark matchers")
+    parser.add_argument(
+        "matcherTypes",
+        type=MatcherType,
+        choices=list(MatcherType),
+        nargs="*",
+        default=list(MatcherType),
+        help="Matcher types to benchmark, only their modules are imported (default: all)"
+    )
+    parser.add_argument(
+        "--calibrate",
+        action="store_true",
+        help="Only measure the distances of the binary matchers that correspond to the ones of ORB"
+    )
+    args = parser.parse_args()
+    sequence, boxes_per_frame = load_sequence()
+    if args.calibrate:
+        calibrate_binary_matchers(args.matcherTypes, sequence)
+    else:
+        benchmark_all_backends(args.matcherTypes)
+        benchmark_matchers(args.matcherTypes, sequence, boxes_per_frame)
@@ -0,0 +1,96 @@
+"""
+Resize Backend Comparison
+
+Check that the OpenCV resize backend of Mask R-CNN stays within the documented tolerance of the scikit-image
+backend: unmolded masks within OPENCV_RESIZE_MIN_MASK_IOU (mrcnn/utils.py) and resized input images within
+MAX_IMAGE_DIFFERENCE grey levels. Reports the speed up and exits with status 1 if a tolerance is exceeded, so that it
+can be run before selecting the OPENCV backend or after updating OpenCV:
+    python -m utils.ResizeBackendComparison
+"""
+
+import os
+import sys
+from time import time
+
+import cv2
+import numpy as np
+
+from Constants import ROOT_DIR
+from mrcnn import utils
+
+IMAGE_PATH = os.path.join(ROOT_DIR, "data/imageSet/kitti/1000/000000.png")
+MAX_IMAGE_DIFFERENCE = 1  # grey levels, rounding of the interpolated values
+# (min_dim, max_dim) of the network input as in the Mask R-CNN configs, downscaling and upscaling the image
+INPUT_DIMENSIONS = [(800, 1024), (1024, 1024), (256, 256)]
+
+
+def mask_iou(mask_a, mask_b) -> float:
+    """
+    :returns intersection over union of two boolean masks of the same shape
+    """
+    union = np.count_nonzero(mask_a | mask_b)
+    return np.count_nonzero(mask_a & mask_b) / union if union > 0 else 1.0
+
+
+def compare_mask_resizing(number_of_masks=500, seed=0):
+    """
+    Unmolds random masks in the style of the network output (28x28, smooth or sharp) to random box sizes from a few
+    pixels to larger than the mask with both backends.
+    :returns list of the IoUs between the resulting masks
+    """
+    rng = np.random.RandomState(seed)
+    ious = []
+    for i in range(number_of_masks):
+        mask = cv2.GaussianBlur(rng.rand(28, 28).astype(np.float32), (0, 0), 3 if i % 2 == 0 else 0.5)
+        mask = (mask - mask.min()) / (mask.max() - mask.min())
+        y1, x1 = rng.randint(0, 500, 2)
+        height, width = rng.randint(2, 800, 2)
+        bbox = (y1, x1, y1 + height, x1 + width)
+        mask_skimage = utils.unmold_mask_cropped(mask, bbox, backend="skimage")
+        mask_opencv = utils.unmold_mask_cropped(mask, bbox, backend="opencv")
+        ious.append(mask_iou(mask_skimage, mask_opencv))
+    return ious
+
+
+def compare_image_resizing(image, min_dim, max_dim):
+    """
+    Resizes the image as done for the network input with both backends.
+    :returns tuple of the maximum absolute pixel difference, time for skimage and time for opencv
+    """
+    start = time()
+    image_skimage = utils.resize_image(image, min_dim=min_dim, max_dim=max_dim, backend="skimage")[0]
+    time_skimage = time() - start
+    start = time()
+    image_opencv = utils.resize_image(image, min_dim=min_dim, max_dim=max_dim, backend="opencv")[0]
+    time_opencv = time() - start
+    max_difference = np.abs(image_skimage.astype(np.int32) - image_opencv.astype(np.int32)).max()
+    return max_difference, time_skimage, time_opencv
+
+
+def check_resize_backends() -> bool:
+    """
+    Prints the results of both comparisons
+    :returns whether the OpenCV backend is within all tolerances
+    """
+    mask_ious = compare_mask_resizing()
+    masks_within_tolerance = min(mask_ious) >= utils.OPENCV_RESIZE_MIN_MASK_IOU
+    print(f"Mask IoU opencv vs. skimage: min {min(mask_ious):.4f}, mean {np.mean(mask_ious):.4f} "
+          f"(tolerance {utils.OPENCV_RESIZE_MIN_MASK_IOU}): {'ok' if masks_within_tolerance else 'FAILED'}")
+
+    test_image = cv2.imread(IMAGE_PATH)
+    if test_image is None:
+        print(f"{IMAGE_PATH} not found, using a random image")
+        test_image = np.random.RandomState(0).randint(0, 256, (375, 1242, 3)).astype(np.uint8)
+    images_within_tolerance = True
+    for min_dim, max_dim in INPUT_DIMENSIONS:
+        difference, duration_skimage, duration_opencv = compare_image_resizing(test_image, min_dim, max_dim)
+        images_within_tolerance &= difference <= MAX_IMAGE_DIFFERENCE
+        print(f"Image resizing to {min_dim}-{max_dim}: max pixel difference {difference} (tolerance {MAX_IMAGE_DIFFERENCE}): "
+              f"{'ok' if difference <= MAX_IMAGE_DIFFERENCE else 'FAILED'}, skimage {duration_skimage:.3f}s, opencv {duration_opencv:.3f}s")
+    return masks_within_tolerance and images_within_tolerance
+
+
+if __name__ == "__main__":
+    if not check_resize_backends():
+        print("OpenCV resize backend exceeds the documented tolerance")
+        sys.exit(1)
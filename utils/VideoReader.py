@@ -0,0 +1,78 @@
+"""
+Video Reader
+
+Reads video files frame by frame with OpenCV. In contrast to moviepy, OpenCV can seek within the container directly
+and already returns frames in the BGR order used throughout the project.
+"""
+import os
+from typing import Optional, Tuple
+
+import cv2.cv2 as cv2
+import numpy as np
+
+
+class OpenCvVideoReader:
+    """
+    Class reading frames and their timestamps from a video file via cv2.VideoCapture
+    """
+
+    def __init__(self, path_to_video):
+        self.path = os.path.abspath(path_to_video)
+        self.capture = cv2.VideoCapture(self.path)
+        if not self.capture.isOpened():
+            raise Exception(f"Could not open video {self.path}")
+        self.fps: float = self.capture.get(cv2.CAP_PROP_FPS)  # as stated by the container
+        self.frame_count: int = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    def seek_time(self, sec: float):
+        """
+        Sets the position of the reader close to the given second. Depending on the container, the next frame read may
+        still start slightly before it.
+        """
+        self.capture.set(cv2.CAP_PROP_POS_MSEC, sec * 1000)
+
+    def read(self) -> Optional[Tuple[float, np.ndarray]]:
+        """
+        Reads the next frame
+        :returns tuple of the timestamp of the frame in seconds and the frame itself (BGR) or None at the end of the video
+        """
+        if not self.capture.grab():
+            return None
+        timestamp = self.capture.get(cv2.CAP_PROP_POS_MSEC) / 1000
+        success, frame = self.capture.retrieve()
+        return (timestamp, frame) if success else None
+
+    def frames(self, from_sec=0, to_sec=None):
+        """
+        Generator yielding (timestamp, frame) for all frames starting in the interval [from_sec, to_sec), so that
+        adjacent intervals never share a frame.
+        The reader gets released once all frames have been read.
+        """
+        try:
+            if from_sec:
+                self.seek_time(from_sec)
+            while True:
+                timestamp_and_frame = self.read()
+                if timestamp_and_frame is None or (to_sec is not None and timestamp_and_frame[0] >= to_sec):
+                    return
+                if timestamp_and_frame[0] < from_sec:
+                    continue  # the seek landed on an earlier frame, which belongs to the previous interval
+                yield timestamp_and_frame
+        finally:
+            self.release()
+
+    def release(self):
+        """
+        Closes the video file
+        """
+        self.capture.release()
+
+
+def get_video_fps(path_to_video) -> float:
+    """
+    :returns the frame rate of a video as stated by its container
+    """
+    reader = OpenCvVideoReader(path_to_video)
+    fps = reader.fps
+    reader.release()
+    return fps
@@ -4,22 +4,22 @@ import csv
 from typing import Optional
 
 from data_model.DetectedObjects import DetectedObjects
-from data_model.ObjectInstance import ObjectInstance
+from data_model.OccurrenceRecord import OccurrenceRecord
 
 
 def write_detected_objects_to_csv(detected_objects: DetectedObjects, prefix=""):
     """
     Writes data collected about the detected_objects to disc in csv format, prefixed by 'prefix'
     """
-    for ot_id, ot in detected_objects.objects.items():
+    for ot_id, ot in detected_objects.get_all_object_tracks().items():
         file = open("export/csv_export/" + prefix + "_" + ot.class_name + "_" + str(ot_id) + ".csv", "w")
         with file:
             writer = csv.writer(file)
-            header = ["index", "id", "class_name", "present", "confidence", "speed (km/h)", "velocity (m/s)", "roi_center", "distance", "3d_position", "# keypoints"]
+            header = ["index", "id", "class_name", "present", "confidence", "speed (km/h)", "velocity (m/s)", "roi_center", "distance", "3d_position", "# keypoints", "interpolated"]
             writer.writerow(header)
-            occurrences: [Optional[ObjectInstance]] = ot.occurrences
+            history: [Optional[OccurrenceRecord]] = ot.history
 
-            for index, occ in enumerate(occurrences):
+            for index, occ in enumerate(history):
                 row = [
                     index,
                     ot_id,
@@ -29,8 +29,9 @@ def write_detected_objects_to_csv(detected_objects: DetectedObjects, prefix=""):
                     "-" if occ is None else occ.speed,
                     "-" if occ is None else occ.velocity,
                     "-" if occ is None else [occ.roi.get_center()],
-                    "-" if occ is None else occ.approximate_distance(),
-                    "-" if occ is None else tuple(map(lambda e: round(e, 2), occ.get_3d_position())),
-                    "-" if occ is None or occ.keypoints is None else len(occ.keypoints),
+                    "-" if occ is None else occ.distance,
+                    "-" if occ is None else tuple(map(lambda e: round(e, 2), occ.position_3d)),
+                    "-" if occ is None or occ.number_of_keypoints is None else occ.number_of_keypoints,
+                    "-" if occ is None else occ.interpolated,
                 ]
                 writer.writerow(row)
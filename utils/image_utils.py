@@ -1,13 +1,15 @@
 """Miscellaneous utility functions for working with images"""
 import glob
 import os
+from functools import partial
 
 import cv2.cv2 as cv2
 from cv2.cv2 import VideoWriter
-from moviepy.video.io.VideoFileClip import VideoFileClip
 
-from Constants import InputDataType, CAMERA_TYPE
+import Constants
+from Constants import InputDataType, VideoReaderType
 from camera_calibration.CameraCalibration import CameraCalibration
+from utils.VideoReader import OpenCvVideoReader
 
 
 def letterbox_image(image, desired_size):
@@ -87,7 +89,7 @@ async def save_debug_image(image, filename, folder=None, resize_to=None):
     cv2.imwrite(path, image)
 
 
-def get_frames(input_type, path, from_sec_or_image=0, to_sec_or_image=None, undistort=False):
+def get_frames(input_type, path, from_sec_or_image=0, to_sec_or_image=None, undistort=False, video_reader=VideoReaderType.OPENCV):
     """
     Retrieves frames from a video or directory in form of a generator.
     :param input_type: May be video or directory of images
@@ -95,38 +97,80 @@ def get_frames(input_type, path, from_sec_or_image=0, to_sec_or_image=None, undi
     :param from_sec_or_image: first frame
     :param to_sec_or_image: last frame
     :param undistort: images should be undistorted before being returned
+    :param video_reader: library used to decode videos
     :return: a frame in a yielding fashion
     """
     if input_type == InputDataType.VIDEO:
-        return get_frames_from_video(path, from_sec_or_image, to_sec_or_image, undistort)
+        return get_frames_from_video(path, from_sec_or_image, to_sec_or_image, undistort, video_reader)
     elif input_type == InputDataType.IMAGE:
         return get_frames_from_image_directory(path, from_image=from_sec_or_image, to_image=to_sec_or_image, undistort=undistort)
     else:
         raise Exception("Unknown input_type")
 
 
-def get_frames_from_video(path_to_video, from_sec=0, to_sec=None, undistort=False):
+def get_frame_loader(input_type, path, from_sec_or_image=0, to_sec_or_image=None, undistort=False, video_reader=VideoReaderType.OPENCV):
     """
-    Generator that reads a video file from disk and yields a color correct frame at a time
+    Splits the retrieval of frames into a sequential part and a part that can be run for each frame independently.
+    :param input_type: May be video or directory of images
+    :param path: path to video or images
+    :param from_sec_or_image: first frame
+    :param to_sec_or_image: last frame
+    :param undistort: images should be undistorted before being returned
+    :param video_reader: library used to decode videos
+    :return: tuple of a generator of (timestamp, raw frame) and a function that turns a raw frame into a color correct
+    (and optionally undistorted) frame. Raw frames are decoded video frames or image paths, timestamps are seconds
+    within the video or None for images.
     """
-    camera_calibration = CameraCalibration(CAMERA_TYPE)
+    camera_calibration = CameraCalibration(Constants.CAMERA_TYPE) if undistort else None
+    if input_type == InputDataType.VIDEO and video_reader == VideoReaderType.OPENCV:
+        # OpenCV already decodes to BGR
+        raw_frames = OpenCvVideoReader(path).frames(from_sec_or_image, to_sec_or_image)
+        return raw_frames, partial(prepare_video_frame, camera_calibration=camera_calibration, convert_color=False)
+    elif input_type == InputDataType.VIDEO:
+        return read_video_frames(path, from_sec_or_image, to_sec_or_image), partial(prepare_video_frame, camera_calibration=camera_calibration)
+    elif input_type == InputDataType.IMAGE:
+        image_paths = get_image_paths(path, from_image=from_sec_or_image, to_image=to_sec_or_image)
+        return ((None, image_path) for image_path in image_paths), partial(prepare_image_frame, camera_calibration=camera_calibration)
+    else:
+        raise Exception("Unknown input_type")
 
-    fullpath = os.path.abspath(path_to_video)
-    video = VideoFileClip(fullpath, audio=False).subclip(from_sec, to_sec)
-    for frame in video.iter_frames():
-        # We have to switch the order of channels as opencv has a different order as they are coming from the camera
-        color_corrected_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        if undistort:
-            color_corrected_frame = camera_calibration.undistort(color_corrected_frame)
-        yield color_corrected_frame
+
+def get_frames_from_video(path_to_video, from_sec=0, to_sec=None, undistort=False, video_reader=VideoReaderType.OPENCV):
+    """
+    Generator that reads a video file from disk and yields a color correct frame at a time
+    """
+    raw_frames, prepare_frame = get_frame_loader(InputDataType.VIDEO, path_to_video, from_sec, to_sec, undistort, video_reader)
+    for _, frame in raw_frames:
+        yield prepare_frame(frame)
 
 
 def get_frames_from_image_directory(path, image_types=None, from_image=0, to_image=None, undistort=False):
     """
     Generator that reads a directory of images from disk and yields a image at a time
     """
-    camera_calibration = CameraCalibration(CAMERA_TYPE)
+    camera_calibration = CameraCalibration(Constants.CAMERA_TYPE) if undistort else None
+    for image_path in get_image_paths(path, image_types, from_image, to_image):
+        yield prepare_image_frame(image_path, camera_calibration)
 
+
+def read_video_frames(path_to_video, from_sec=0, to_sec=None):
+    """
+    Generator that decodes a video file with moviepy and yields (timestamp, frame) with the frames as they come from
+    the decoder (RGB)
+    """
+    # Only imported when used as moviepy takes a while to import and is not needed for the OpenCV reader
+    from moviepy.video.io.VideoFileClip import VideoFileClip
+
+    fullpath = os.path.abspath(path_to_video)
+    video = VideoFileClip(fullpath, audio=False).subclip(from_sec, to_sec)
+    for time_in_clip, frame in video.iter_frames(with_times=True):
+        yield from_sec + time_in_clip, frame
+
+
+def get_image_paths(path, image_types=None, from_image=0, to_image=None) -> [str]:
+    """
+    :returns sorted paths of the images in the directory, limited to the range [from_image, to_image)
+    """
     if image_types is None:
         image_types = ["png", "jpg"]
     full_path_to_dir = os.path.abspath(path)
@@ -134,11 +178,28 @@ def get_frames_from_image_directory(path, image_types=None, from_image=0, to_ima
     for image_type in image_types:
         image_paths.extend(glob.glob(os.path.join(full_path_to_dir, "*." + image_type)))
     image_paths.sort()
-    for image_path in image_paths[from_image:to_image]:
-        image = cv2.imread(image_path)
-        if undistort:
-            image = camera_calibration.undistort(image)
-        yield image
+    return image_paths[from_image:to_image]
+
+
+def prepare_video_frame(frame, camera_calibration=None, convert_color=True):
+    """
+    Turns a decoded video frame into a color correct frame and undistorts it if a camera_calibration is provided
+    """
+    # We have to switch the order of channels as opencv has a different order as they are coming from the camera
+    color_corrected_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) if convert_color else frame
+    if camera_calibration is not None:
+        color_corrected_frame = camera_calibration.undistort(color_corrected_frame)
+    return color_corrected_frame
+
+
+def prepare_image_frame(image_path, camera_calibration=None):
+    """
+    Reads an image from disk and undistorts it if a camera_calibration is provided
+    """
+    image = cv2.imread(image_path)
+    if camera_calibration is not None:
+        image = camera_calibration.undistort(image)
+    return image
 
 
 def draw_rectangle(image, box, color=(0, 0, 255), thickness=2, offset=(0, 0)):
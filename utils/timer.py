@@ -1,12 +1,14 @@
 """Functions used to measure the execution time of a wrapped function"""
 from collections import Counter
 from functools import wraps
+from threading import Lock
 from time import time
 
 from tabulate import tabulate
 
 number_of_calls = Counter()
 total_time_per_function = Counter()
+_counter_lock = Lock()  # timed functions may also run in background threads
 
 
 def timing(function_to_time):
@@ -20,8 +22,9 @@ def timing(function_to_time):
         start = time()
         result = function_to_time(*args, **kwargs)
         end = time()
-        number_of_calls[function_to_time.__name__] += 1
-        total_time_per_function[function_to_time.__name__] += end - start
+        with _counter_lock:
+            number_of_calls[function_to_time.__name__] += 1
+            total_time_per_function[function_to_time.__name__] += end - start
         return result
 
     return wrapper